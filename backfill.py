@@ -0,0 +1,187 @@
+"""Импорт старых задач из экспорта истории Telegram Desktop (result.json).
+
+Файл читается потоково, кусками, поэтому экспорт в несколько гигабайт не нужно
+загружать в память целиком. Из чатов MONITOR_CHATS берутся сообщения с
+отслеживаемыми хэштегами и пачками записываются в архив задач; повторный
+импорт того же экспорта не создаёт дублей.
+
+Запуск: python backfill.py путь/к/result.json [ещё файлы...]
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import logging
+import os
+import re
+import time
+from typing import Iterator, Optional, TextIO, Tuple
+
+from bot import task_archive, task_classifier
+from task_store import TaskRecord
+
+
+logger = logging.getLogger("backfill")
+
+CHUNK_SIZE = 1 << 20
+MESSAGES_RE = re.compile(r'"messages"\s*:\s*\[')
+CHAT_ID_RE = re.compile(r'"id"\s*:\s*(-?\d+)')
+CHAT_TYPE_RE = re.compile(r'"type"\s*:\s*"(\w+)"')
+_decoder = json.JSONDecoder()
+
+
+def export_chat_id(raw_id: int, chat_type: Optional[str]) -> int:
+    # В экспорте ID чатов хранятся без префикса, который использует Bot API
+    if chat_type in ("private_group",):
+        return -raw_id
+    if chat_type in ("personal_chat", "bot_chat", "saved_messages"):
+        return raw_id
+    return int(f"-100{raw_id}")
+
+
+def iter_export_messages(stream: TextIO) -> Iterator[Tuple[int, dict]]:
+    """Отдаёт пары (chat_id, сообщение) из экспорта одного чата или всего аккаунта.
+
+    Заголовок чата (name, type, id) в экспорте идёт перед массивом messages,
+    поэтому ID чата берётся из текста между массивами сообщений, а сами сообщения
+    разбираются по одному через JSONDecoder.raw_decode.
+    """
+    buffer = ""
+    pos = 0
+    eof = False
+
+    def fill() -> bool:
+        nonlocal buffer, pos, eof
+        chunk = stream.read(CHUNK_SIZE)
+        if not chunk:
+            eof = True
+            return False
+        buffer = buffer[pos:] + chunk
+        pos = 0
+        return True
+
+    while True:
+        match = MESSAGES_RE.search(buffer, pos)
+        if match is None:
+            if eof:
+                return
+            # Хвост оставляем: в нём может начинаться заголовок следующего чата
+            pos = max(pos, len(buffer) - 4096)
+            fill()
+            continue
+        header = buffer[pos:match.start()]
+        ids = CHAT_ID_RE.findall(header)
+        chat_types = CHAT_TYPE_RE.findall(header)
+        chat_id = export_chat_id(int(ids[-1]), chat_types[-1] if chat_types else None) if ids else None
+        pos = match.end()
+
+        while True:
+            # Пропускаем пробелы и запятые между сообщениями
+            while True:
+                while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                    pos += 1
+                if pos < len(buffer) or not fill():
+                    break
+            if pos >= len(buffer):
+                return
+            if buffer[pos] == "]":
+                pos += 1
+                break
+            try:
+                message, end = _decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # Сообщение обрезано границей куска — дочитываем
+                if not fill():
+                    raise
+                continue
+            pos = end
+            if chat_id is not None:
+                yield chat_id, message
+
+
+def message_text(message: dict) -> str:
+    text = message.get("text", "")
+    if isinstance(text, list):
+        # Текст с разметкой хранится списком строк и сущностей вида {"type": "hashtag", "text": "#Тег"}
+        return "".join(part if isinstance(part, str) else part.get("text", "") for part in text)
+    return text
+
+
+def message_timestamp(message: dict) -> int:
+    if "date_unixtime" in message:
+        return int(message["date_unixtime"])
+    # В старых экспортах есть только локальное время без часового пояса
+    return int(datetime.datetime.fromisoformat(message["date"]).timestamp())
+
+
+def message_user_id(message: dict) -> Optional[int]:
+    from_id = message.get("from_id") or ""
+    if from_id.startswith("user") and from_id[4:].isdigit():
+        return int(from_id[4:])
+    return None
+
+
+def task_from_export(chat_id: int, message: dict) -> Optional[TaskRecord]:
+    if message.get("type") != "message" or chat_id not in task_classifier.chat_ids:
+        return None
+    text = message_text(message)
+    tags = task_classifier.extract(text) if text else None
+    if not tags:
+        return None
+    return TaskRecord(
+        chat_id=chat_id,
+        message_id=message["id"],
+        timestamp=message_timestamp(message),
+        text=text,
+        tags=tags,
+        user_id=message_user_id(message),
+        # Задача идёт только в архив, поэтому текст сохраняется целиком
+        text_limit=None
+    )
+
+
+async def backfill(paths, batch_size: int, progress_every: int) -> None:
+    task_archive.batch_size = batch_size
+    await task_archive.open()
+    started = time.perf_counter()
+    messages = tasks = inserted = 0
+    try:
+        for path in paths:
+            size = os.path.getsize(path)
+            with open(path, encoding="utf-8") as stream:
+                for chat_id, message in iter_export_messages(stream):
+                    messages += 1
+                    task = task_from_export(chat_id, message)
+                    if task is not None:
+                        tasks += 1
+                        task_archive.enqueue(task)
+                        if tasks % batch_size == 0:
+                            inserted += await task_archive.flush()
+                    if messages % progress_every == 0:
+                        elapsed = time.perf_counter() - started
+                        logger.info(
+                            f"{path}: {stream.tell() * 100 // max(size, 1)}%, сообщений {messages}, "
+                            f"задач {tasks}, новых {inserted}, {messages / elapsed:,.0f} сообщений/с"
+                        )
+        inserted += await task_archive.flush()
+    finally:
+        await task_archive.close()
+    elapsed = time.perf_counter() - started
+    logger.info(
+        f"Импорт завершён за {elapsed:.1f} с: сообщений {messages}, задач {tasks}, "
+        f"добавлено новых {inserted}, уже были в архиве {tasks - inserted} "
+        f"({messages / max(elapsed, 1e-9):,.0f} сообщений/с)"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="+", help="файлы result.json из экспорта Telegram Desktop")
+    parser.add_argument("--batch-size", type=int, default=5000, help="задач в одной транзакции")
+    parser.add_argument("--progress-every", type=int, default=100000, help="сообщений между отчётами")
+    args = parser.parse_args()
+    asyncio.run(backfill(args.paths, args.batch_size, args.progress_every))
+
+
+if __name__ == "__main__":
+    main()
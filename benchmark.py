@@ -0,0 +1,865 @@
+"""Бенчмарки хранилища задач и обработчиков бота.
+
+Запуск: python benchmark.py <сценарий> [параметры]
+"""
+import argparse
+import asyncio
+import atexit
+import contextlib
+import datetime
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from collections import Counter, defaultdict, deque
+from itertools import islice
+from typing import Any, Deque, Dict, Iterator, List, Optional, Sequence
+
+import aiogram
+from aiogram import Bot, Dispatcher, F, types
+from aiogram.client.session.base import BaseSession
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import TelegramMethod
+
+from logging_setup import TEXT_FORMAT, setup_logging
+from metrics import MetricsMiddleware, MetricsRegistry
+from outbound import PRIORITY_BACKGROUND, OutboundLimiter, outbound_priority
+
+from reminders import Reminder, ReminderScheduler
+from render_cache import RenderCache
+from task_archive import Database, TaskArchive
+from task_search import SearchQuery, TextIndex
+from task_stats import TaskStats
+from task_store import TaskRecord, TaskStore
+from tracker_mock import MockTracker
+from tracker_sync import TrackerClient, TrackerSync
+
+
+CHATS = (-1002224942388, -1002481390495)
+TAG_SETS = (
+    ("#Критичный",),
+    ("#Критичный", "#Блокер"),
+    ("#Критичный", "#Релиз"),
+    ("#Критичный", "#Приемка"),
+    ("#Критичный", "#Быстрый_Тест"),
+    ("#Критичный", "#Крит_Блокер"),
+)
+WORDS = ("платеж", "авторизация", "релиз", "сборка", "отчет", "доступ", "сервер", "форма", "ошибка", "дашборд")
+
+
+def generate_tasks(count: int, users: int = 1000, seed: int = 1, words: int = 12,
+                   vocabulary: Sequence[str] = WORDS) -> List[TaskRecord]:
+    rnd = random.Random(seed)
+    start = int(time.time()) - count
+    tasks = []
+    for i in range(count):
+        tags = rnd.choice(TAG_SETS)
+        text = " ".join(tags) + " " + " ".join(rnd.choices(vocabulary, k=words)) + f" #{i}"
+        tasks.append(TaskRecord(
+            chat_id=CHATS[i % len(CHATS)],
+            message_id=i + 1,
+            timestamp=start + i,
+            text=text,
+            tags=tags,
+            user_id=rnd.randrange(users),
+            username=f"user{i % users}",
+            text_limit=len(text)
+        ))
+    return tasks
+
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def report_latency(name: str, samples: List[float]) -> None:
+    print(f"{name}: p50={percentile(samples, 50) * 1e6:.1f} мкс  "
+          f"p99={percentile(samples, 99) * 1e6:.1f} мкс  mean={statistics.mean(samples) * 1e6:.1f} мкс")
+
+
+async def bench_storage(args) -> None:
+    tasks = generate_tasks(args.count)
+    with tempfile.TemporaryDirectory() as tmp:
+        archive = TaskArchive(Database(os.path.join(tmp, "tasks.db")), batch_size=args.batch_size)
+        await archive.open()
+
+        started = time.perf_counter()
+        for i, task in enumerate(tasks, 1):
+            archive.enqueue(task)
+            if i % args.batch_size == 0:
+                # Отдаём управление циклу, как между апдейтами: пачки пишет фоновая задача архива
+                await asyncio.sleep(0)
+        await archive.flush()
+        elapsed = time.perf_counter() - started
+        print(f"Запись в SQLite: {args.count} задач за {elapsed:.2f} с ({args.count / elapsed:,.0f} задач/с)")
+
+        started = time.perf_counter()
+        warm = await archive.load_recent(0, args.count)
+        store = TaskStore()
+        for task in reversed(warm):
+            store.add(task)
+        elapsed = time.perf_counter() - started
+        print(f"Прогрев памяти: {len(store)} задач за {elapsed:.2f} с")
+        await archive.close()
+
+    user_ids = [random.randrange(1000) for _ in range(args.queries)]
+    samples = []
+    for user_id in user_ids:
+        started = time.perf_counter()
+        store.latest(tags=("#Критичный",), user_id=user_id)
+        samples.append(time.perf_counter() - started)
+    report_latency("/crittask (выборка)", samples)
+
+    samples = []
+    for user_id in user_ids:
+        started = time.perf_counter()
+        store.latest(tags=("#Релиз", "#Приемка", "#Быстрый_Тест"), user_id=user_id)
+        samples.append(time.perf_counter() - started)
+    report_latency("/releasetask (выборка)", samples)
+
+
+class FakeSession(BaseSession):
+    """Сессия бота без сети: отвечает как Bot API и при желании имитирует flood control.
+
+    Лимиты: 30 сообщений в секунду на бота и 20 сообщений в минуту на группу.
+    Окна делятся на scale, чтобы прогон укладывался в секунды.
+    """
+
+    def __init__(self, flood_control: bool = False, scale: float = 1.0, latency: float = 0.0,
+                 random_flood: float = 0.0) -> None:
+        super().__init__()
+        self.flood_control = flood_control
+        # Доля запросов, на которые API отвечает 429 независимо от нагрузки
+        self.random_flood = random_flood
+        self._random = random.Random(1)
+        self.latency = latency
+        self.scale = scale
+        self.calls: Dict[str, int] = defaultdict(int)
+        self.flood_errors = 0
+        self._global: Deque[float] = deque()
+        self._groups: Dict[int, Deque[float]] = defaultdict(deque)
+        self._message_id = 0
+
+    async def close(self) -> None:
+        pass
+
+    async def stream_content(self, *args: Any, **kwargs: Any):
+        yield b""
+
+    def _check_flood(self, method: TelegramMethod[Any]) -> None:
+        now = time.monotonic()
+        chat_id = getattr(method, "chat_id", None)
+        windows = [(self._global, 1.0 / self.scale, 30)]
+        if isinstance(chat_id, int) and chat_id < 0:
+            windows.append((self._groups[chat_id], 60.0 / self.scale, 20))
+        for sent, window, limit in windows:
+            while sent and now - sent[0] > window:
+                sent.popleft()
+            if len(sent) >= limit:
+                self.flood_errors += 1
+                # Bot API отдаёт retry_after целым числом секунд
+                raise TelegramRetryAfter(method=method, message="Too Many Requests", retry_after=1)
+        for sent, _, _ in windows:
+            sent.append(now)
+
+    async def make_request(self, bot: Bot, method: TelegramMethod[Any], timeout: Optional[int] = None) -> Any:
+        name = type(method).__name__
+        self.calls[name] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.flood_control:
+            if self.random_flood and self._random.random() < self.random_flood:
+                self.flood_errors += 1
+                raise TelegramRetryAfter(method=method, message="Too Many Requests", retry_after=1)
+            self._check_flood(method)
+        returning = getattr(method, "__returning__", None)
+        if returning is types.Message:
+            self._message_id += 1
+            chat_id = getattr(method, "chat_id", 0)
+            return types.Message(
+                message_id=self._message_id,
+                date=datetime.datetime.now(datetime.timezone.utc),
+                chat=types.Chat(id=chat_id, type="supergroup" if chat_id < 0 else "private"),
+                text=getattr(method, "text", None),
+            )
+        if returning is types.User:
+            return types.User(id=1, is_bot=True, first_name="bench", username="bench_bot")
+        return True
+
+
+def fake_bot(session: BaseSession) -> Bot:
+    return Bot(token="123456:BENCHMARKBENCHMARKBENCHMARKBENCHMA", session=session)
+
+
+def legacy_task(task: TaskRecord) -> dict:
+    # Формат записи архива до перехода на TaskRecord: полный текст и готовые строки ссылки и даты
+    return {
+        "text": task.text,
+        "link": f"https://t.me/c/{str(task.chat_id).replace('-100', '')}/{task.message_id}",
+        "date": task.date,
+        "user_id": task.user_id,
+        "username": f"{task.username}",
+    }
+
+
+async def bench_memory(args) -> None:
+    tasks = generate_tasks(args.count, words=args.words)
+    texts = [task.text for task in tasks]
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    legacy = [legacy_task(task) for task in tasks]
+    legacy_bytes = tracemalloc.get_traced_memory()[0] - before
+    del legacy
+    tracemalloc.stop()
+
+    # Тексты уже лежат в памяти генератора, поэтому при замере создаём их заново в обоих вариантах
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    legacy_texts = [text.encode().decode() for text in texts]
+    text_bytes = tracemalloc.get_traced_memory()[0] - before
+    del legacy_texts
+    tracemalloc.stop()
+
+    def records() -> Iterator[TaskRecord]:
+        for task in tasks:
+            yield TaskRecord(task.chat_id, task.message_id, task.timestamp, task.text.encode().decode(),
+                             task.tags, task.user_id, task.username)
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    plain = list(records())
+    record_bytes = tracemalloc.get_traced_memory()[0] - before
+    del plain
+    tracemalloc.stop()
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    store = TaskStore()
+    for task in records():
+        store.add(task)
+    store_bytes = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    print(f"Задач: {args.count}, средняя длина текста: {statistics.mean(map(len, texts)):.0f} символов")
+    print(f"До (dict в списке): {(legacy_bytes + text_bytes) / args.count:.0f} байт/задачу")
+    print(f"После (TaskRecord в списке): {record_bytes / args.count:.0f} байт/задачу")
+    print(f"После (TaskRecord + индексы TaskStore): {store_bytes / args.count:.0f} байт/задачу")
+    print(f"Оценка TaskStore.bytes_used: {store.bytes_used / args.count:.0f} байт/задачу")
+
+
+def synthetic_vocabulary(size: int, seed: int = 2) -> List[str]:
+    # Псевдослова из слогов: словарь реального чата намного больше десятка слов WORDS
+    rnd = random.Random(seed)
+    syllables = ("ба", "ве", "го", "ду", "жи", "за", "ки", "ло", "ми", "но", "пу", "ре", "са", "ти", "фо", "ха")
+    words = set(WORDS)
+    while len(words) < size:
+        words.add("".join(rnd.choices(syllables, k=rnd.randint(2, 5))))
+    return sorted(words)
+
+
+async def bench_search(args) -> None:
+    vocabulary = synthetic_vocabulary(args.vocabulary)
+    # Слова из WORDS встречаются в половине позиций текста, как частые рабочие термины
+    weighted = list(WORDS) * (len(vocabulary) // len(WORDS)) + vocabulary
+    rnd = random.Random(3)
+    queries = {
+        "частое слово": lambda: "платеж ",
+        "редкое слово": lambda: rnd.choice(vocabulary) + " ",
+        "префикс": lambda: rnd.choice(vocabulary)[:3],
+        "префикс частого слова": lambda: rnd.choice(WORDS)[:4],
+        "два слова": lambda: f"{rnd.choice(WORDS)} {rnd.choice(vocabulary)[:4]}",
+    }
+    for count in args.counts:
+        tasks = generate_tasks(count, users=args.users, vocabulary=weighted)
+        store = TaskStore(text_index=TextIndex())
+        started = time.perf_counter()
+        for task in tasks:
+            store.add(task)
+        elapsed = time.perf_counter() - started
+        print(f"\nЗадач: {count}, пользователей: {args.users}, построение индекса: {elapsed:.2f} с "
+              f"({count / elapsed:,.0f} задач/с)")
+
+        for name, make_query in queries.items():
+            samples, pages = [], []
+            for _ in range(args.queries):
+                user_id = rnd.randrange(args.users)
+                query = SearchQuery(make_query())
+                started = time.perf_counter()
+                found = store.search(query, user_id, limit=20)
+                samples.append(time.perf_counter() - started)
+                if len(found) == 20:
+                    # Следующая страница по next_offset
+                    started = time.perf_counter()
+                    store.search(query, user_id, limit=20, before=found[-1].key)
+                    pages.append(time.perf_counter() - started)
+            report_latency(f"  {name}", samples)
+            if pages:
+                report_latency(f"  {name}, 2-я страница", pages)
+
+        # Для сравнения — перебор всех задач без индекса
+        samples = []
+        for _ in range(min(args.queries, 20)):
+            user_id = rnd.randrange(args.users)
+            query = SearchQuery(rnd.choice(vocabulary) + " ")
+            started = time.perf_counter()
+            [task for task in tasks if task.user_id == user_id and query.matches(task.text)][-20:]
+            samples.append(time.perf_counter() - started)
+        report_latency("  перебор без индекса (редкое слово)", samples)
+
+
+async def bench_metrics(args) -> None:
+    bot = fake_bot(FakeSession())
+
+    def make_dispatcher(with_metrics: bool) -> Dispatcher:
+        dp = Dispatcher()
+
+        @dp.message(F.text.startswith("#"))
+        async def on_task(message: types.Message) -> None:
+            pass
+
+        if with_metrics:
+            registry = MetricsRegistry()
+            MetricsMiddleware(registry).setup(dp)
+        return dp
+
+    updates = [
+        types.Update.model_validate({"update_id": i, "message": {
+            "message_id": i, "date": 1700000000, "chat": {"id": CHATS[0], "type": "supergroup"},
+            "from": {"id": 42, "is_bot": False, "first_name": "Test"}, "text": "#Критичный платеж"
+        }}, context={"bot": bot})
+        for i in range(args.count)
+    ]
+    # Прогоны чередуются, берётся лучший: так меньше влияет шум планировщика и сборщика мусора
+    results = {False: float("inf"), True: float("inf")}
+    for _ in range(args.rounds):
+        for with_metrics in (False, True):
+            dp = make_dispatcher(with_metrics)
+            started = time.perf_counter()
+            for update in updates:
+                await dp.feed_update(bot, update)
+            results[with_metrics] = min(results[with_metrics], (time.perf_counter() - started) / args.count)
+    print(f"Без метрик: {results[False] * 1e6:.1f} мкс/апдейт")
+    print(f"С метриками: {results[True] * 1e6:.1f} мкс/апдейт "
+          f"(+{(results[True] - results[False]) * 1e6:.1f} мкс, {results[True] / results[False] - 1:+.1%})")
+
+
+async def bench_paging(args) -> None:
+    store = TaskStore()
+    for task in generate_tasks(args.count, users=args.users):
+        store.add(task)
+    print(f"Задач в памяти: {len(store)}, страница {args.page_size} задач")
+    for tags in (("#Критичный",), ("#Релиз", "#Приемка", "#Быстрый_Тест"), None):
+        name = " ".join(tags) if tags else "все задачи"
+        # Листаем до нужной страницы по ключу последней задачи, как кнопка ▶
+        keys = {}
+        before = None
+        for page in range(1, max(args.pages) + 1):
+            tasks = store.latest(tags=tags, limit=args.page_size, before=before)
+            if not tasks:
+                break
+            keys[page] = before
+            before = tasks[-1].key
+        for page in args.pages:
+            if page not in keys:
+                continue
+            samples = []
+            for _ in range(args.queries):
+                started = time.perf_counter()
+                store.latest(tags=tags, limit=args.page_size + 1, before=keys[page])
+                samples.append(time.perf_counter() - started)
+            # Для сравнения: страница через пропуск предыдущих задач (OFFSET). Отдельным циклом,
+            # чтобы проход по тысячам задач не вытеснял из кэша процессора данные первого замера
+            offset = []
+            for _ in range(args.queries):
+                started = time.perf_counter()
+                list(islice(store.iter_latest(tags=tags), (page - 1) * args.page_size,
+                            page * args.page_size + 1))
+                offset.append(time.perf_counter() - started)
+            print(f"{name}, стр. {page}: по ключу p50={percentile(samples, 50) * 1e6:.1f} мкс, "
+                  f"со смещением p50={percentile(offset, 50) * 1e6:.1f} мкс")
+
+
+async def bench_logging(args) -> None:
+    tasks = generate_tasks(args.count)
+
+    async def run(mode: str) -> None:
+        root = logging.getLogger()
+        logger = logging.getLogger("bot")
+        store = TaskStore()
+        gaps: List[float] = []
+        done = asyncio.Event()
+
+        async def monitor() -> None:
+            # Насколько позже заказанной 1 мс просыпается задача: это и есть время блокировки цикла
+            while not done.is_set():
+                started = time.perf_counter()
+                await asyncio.sleep(0.001)
+                gaps.append(time.perf_counter() - started - 0.001)
+
+        async def handle(number: int, task: TaskRecord) -> None:
+            store.add(task)
+            if mode == "sampled":
+                logger.debug("Добавлена задача %s из чата %s: %.30s...", " ".join(sorted(task.tags)), task.chat_id,
+                             task.text)
+                if number % args.every == 0:
+                    logger.info("Собрано задач с запуска: %d, последняя из чата %s", number, task.chat_id)
+            else:
+                logger.info(f"Добавлена задача {' '.join(sorted(task.tags))} из чата {task.chat_id}: {task.text[:30]}...")
+
+        with tempfile.TemporaryDirectory() as directory, \
+                open(os.path.join(directory, "console.log"), "w", encoding="utf-8") as console, \
+                contextlib.redirect_stderr(console):
+            # Консоль перенаправлена в файл, как stdout бота под systemd или docker
+            path = os.path.join(directory, "bot.log")
+            listener = None
+            if mode == "sync":
+                logging.basicConfig(level=logging.INFO, format=TEXT_FORMAT, force=True, handlers=[
+                    logging.FileHandler(path, encoding="utf-8"), logging.StreamHandler()])
+            else:
+                listener = setup_logging(path=path, level="INFO")
+            watcher = asyncio.create_task(monitor())
+            await asyncio.sleep(0.01)
+            started = time.perf_counter()
+            # Апдейты приходят пачками, как из getUpdates, и обрабатываются параллельными задачами
+            for offset in range(0, len(tasks), args.batch):
+                batch = tasks[offset:offset + args.batch]
+                await asyncio.gather(*(handle(offset + i + 1, task) for i, task in enumerate(batch)))
+                await asyncio.sleep(0)
+            elapsed = time.perf_counter() - started
+            done.set()
+            await watcher
+            drained = 0.0
+            if listener is not None:
+                drained = time.perf_counter()
+                listener.stop()
+                atexit.unregister(listener.stop)
+                drained = time.perf_counter() - drained
+            for handler in root.handlers[:]:
+                root.removeHandler(handler)
+                handler.close()
+            lines = sum(1 for _ in open(path, encoding="utf-8"))
+        print(f"{mode:>8}: {elapsed:.3f} с ({elapsed / len(tasks) * 1e6:.1f} мкс/сообщение), "
+              f"блокировка цикла max={max(gaps) * 1e3:.2f} мс p99={percentile(gaps, 99) * 1e3:.2f} мс, "
+              f"строк в логе {lines}, дозапись после всплеска {drained * 1e3:.1f} мс")
+
+    print(f"Всплеск из {len(tasks)} сообщений пачками по {args.batch}")
+    # sync — прежняя настройка (запись в файл и консоль в цикле событий), queue — та же запись
+    # через фоновый поток, sampled — фоновый поток и сводка раз в --every задач
+    for mode in ("sync", "queue", "sampled"):
+        await run(mode)
+
+
+async def bench_tracker(args) -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        database = Database(os.path.join(directory, "tasks.db"))
+        archive = TaskArchive(database, batch_size=10000)
+        await archive.open()
+        for task in generate_tasks(args.count):
+            archive.enqueue(task)
+        await archive.close()
+
+        tracker = MockTracker("TG", rate=args.server_rate, latency=args.latency)
+        url = await tracker.start()
+        client = TrackerClient(url, "token", max_concurrency=args.concurrency, rate=args.rate)
+        sync = TrackerSync(database, client, "TG", batch_size=args.batch_size, page_size=args.page_size, interval=0)
+        await sync.open()
+
+        def show(name: str, report) -> None:
+            print(f"{name}: {report.seconds:.2f} с, создано {report.pushed}, получено изменений {report.changed}, "
+                  f"запросов {report.requests}")
+
+        report = await sync.sync()
+        show("Первичная выгрузка", report)
+        print(f"  {report.pushed / report.seconds:.0f} задач/с, соединений с сервером: {len(tracker.connections)}, "
+              f"ответов 429: {tracker.throttled}, повторов: {client.retries}")
+
+        touched = tracker.touch(args.touched, seed=1)
+        calls = Counter(client.calls)
+        report = await sync.sync()
+        show(f"Изменено {len(touched)} задач в Tracker", report)
+        print(f"  запросы: {dict(client.calls - calls)}; опрос каждой задачи отдельно — {args.count} запросов за цикл")
+
+        show("Цикл без изменений", await sync.sync())
+
+        keys = sorted(tracker.issues)[:args.lookups]
+        cache = sync.cache
+        # Свежий кэш после синхронизации, затем TTL истёк: полная загрузка с ETag, затем условные запросы с 304
+        for name, ttl in (("кэш свежий", args.cache_ttl), ("TTL истёк", 0.0), ("TTL истёк, ETag известен", 0.0)):
+            cache.ttl = ttl
+            calls = Counter(client.calls)
+            hits, revalidated, misses = cache.hits, cache.revalidated, cache.misses
+            for key in keys:
+                await sync.status(key)
+            print(f"Статусы {len(keys)} задач, {name}: запросов {sum((client.calls - calls).values())}, "
+                  f"из кэша {cache.hits - hits}, 304 {cache.revalidated - revalidated}, загрузок {cache.misses - misses}")
+        print(f"Всего запросов к API: {client.requests} ({dict(client.calls)}), соединений: {len(tracker.connections)}")
+        await sync.close()
+        await tracker.stop()
+
+
+# Настройки bot.py для прогона без сети: лимиты исходящих сообщений не должны тормозить
+# обработчики, а вытеснение по объёму — сокращать архив до заданного размера
+DISPATCHER_ENV = {
+    "TELEGRAM_TOKEN": "123456:BENCHMARKBENCHMARKBENCHMARKBENCHMA",
+    "MONITOR_CHATS": ",".join(map(str, CHATS)),
+    "METRICS_PORT": "0",
+    "LOG_FILE": "",
+    "RETENTION_MAX_MB": "0",
+    "OUTBOUND_GLOBAL_RATE": "1e9",
+    "OUTBOUND_GROUP_PER_MINUTE": "1e12",
+    "OUTBOUND_PRIVATE_RATE": "1e9",
+}
+# Доли видов апдейтов в потоке
+UPDATE_MIX = (
+    ("hashtag", 70), ("chatter", 10),
+    ("/crittask", 4), ("/bloker", 4), ("/releasetask", 4), ("/task", 4), ("/reminder", 4),
+)
+
+
+def make_updates(bot: Bot, count: int, users: int, seed: int = 4) -> List[Any]:
+    rnd = random.Random(seed)
+    kinds = [kind for kind, _ in UPDATE_MIX]
+    weights = [weight for _, weight in UPDATE_MIX]
+    now = int(time.time())
+    updates = []
+    for i in range(count):
+        kind = rnd.choices(kinds, weights)[0]
+        user_id = rnd.randrange(users)
+        if kind in ("hashtag", "chatter"):
+            chat = {"id": CHATS[i % len(CHATS)], "type": "supergroup", "title": "bench"}
+            words = " ".join(rnd.choices(WORDS, k=8))
+            text = f"{' '.join(rnd.choice(TAG_SETS))} {words}" if kind == "hashtag" else words
+        else:
+            chat = {"id": user_id + 1, "type": "private"}
+            text = kind
+            if kind == "/reminder":
+                text = rnd.choice(("/reminder list", "/reminder 30"))
+        updates.append((kind, types.Update.model_validate({"update_id": i + 1, "message": {
+            # Номера сообщений не пересекаются с задачами, которыми заполнен архив
+            "message_id": 10 ** 9 + i, "date": now, "chat": chat, "text": text,
+            "from": {"id": user_id, "is_bot": False, "first_name": "Bench", "username": f"user{user_id}"},
+        }}, context={"bot": bot})))
+    return updates
+
+
+def git_revision() -> Optional[str]:
+    try:
+        result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return result.stdout.strip() or None
+
+
+def latency_summary(samples: List[float]) -> Dict[str, float]:
+    return {
+        "p50_us": round(percentile(samples, 50) * 1e6, 1),
+        "p99_us": round(percentile(samples, 99) * 1e6, 1),
+        "mean_us": round(statistics.mean(samples) * 1e6, 1),
+    }
+
+
+async def bench_dispatcher(args) -> None:
+    tmp = tempfile.TemporaryDirectory()
+    # Рабочую базу бота не трогаем
+    os.environ["DATABASE_PATH"] = os.path.join(tmp.name, "tasks.db")
+    for name, value in DISPATCHER_ENV.items():
+        os.environ.setdefault(name, value)
+    import bot as app
+    if not args.log:
+        # Лог каждого апдейта в консоль и файл заглушил бы вывод бенчмарка
+        logging.getLogger().setLevel(logging.WARNING)
+
+    session = FakeSession()
+    session.middleware(app.outbound_limiter)
+    app.bot.session = session
+    report = {
+        "scenario": "dispatcher",
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "aiogram": aiogram.__version__,
+        "updates": args.updates,
+        "users": args.users,
+        "logging": args.log,
+        "results": [],
+    }
+    await app.dp.emit_startup(bot=app.bot)
+    try:
+        for size in args.sizes:
+            # Чистое состояние для каждого размера архива
+            app.CriticalTasksArchive = TaskStore(app.CriticalTasksArchive.retention, text_index=TextIndex())
+            app.task_stats = TaskStats(days=app.config.STATS_DAYS, top=app.config.STATS_TOP)
+            app.render_cache = RenderCache(maxsize=app.config.RENDER_CACHE_SIZE)
+            started = time.perf_counter()
+            for task in generate_tasks(size, users=args.users):
+                app.CriticalTasksArchive.add(task)
+                app.task_stats.add(task)
+            print(f"\nАрхив: {size} задач (заполнен за {time.perf_counter() - started:.1f} с)")
+
+            updates = make_updates(app.bot, args.updates, args.users)
+            samples: Dict[str, List[float]] = defaultdict(list)
+            session.calls.clear()
+            started = time.perf_counter()
+            for kind, update in updates:
+                update_started = time.perf_counter()
+                await app.dp.feed_update(app.bot, update)
+                samples[kind].append(time.perf_counter() - update_started)
+                # Между апдейтами цикл событий успевает записать пачку в SQLite, как при polling
+                await asyncio.sleep(0)
+            elapsed = time.perf_counter() - started
+            everything = [sample for kind_samples in samples.values() for sample in kind_samples]
+
+            result = {
+                "archive_size": size,
+                "updates_per_second": round(args.updates / elapsed, 1),
+                "latency": {"all": latency_summary(everything)},
+                "api_calls": dict(session.calls),
+            }
+            print(f"Пропускная способность: {args.updates / elapsed:,.0f} апдейтов/с")
+            report_latency("  все апдейты", everything)
+            for kind, _ in UPDATE_MIX:
+                if samples[kind]:
+                    result["latency"][kind] = latency_summary(samples[kind])
+                    report_latency(f"  {kind}", samples[kind])
+            report["results"].append(result)
+            await app.task_archive.flush()
+    finally:
+        await app.dp.emit_shutdown(bot=app.bot)
+        tmp.cleanup()
+
+    with open(args.output, "w", encoding="utf-8") as output:
+        json.dump(report, output, ensure_ascii=False, indent=2)
+    print(f"\nРезультаты сохранены в {args.output}")
+
+
+async def bench_reminders(args) -> None:
+    fired: List[float] = []
+    jitter: List[float] = []
+    sends = 0
+
+    async def send(chat_id: int, reminders: List[Reminder]) -> None:
+        nonlocal sends
+        now = time.time()
+        sends += 1
+        for reminder in reminders:
+            jitter.append(now - requested[reminder.id])
+            fired.append(now)
+
+    rnd = random.Random(1)
+    delays = [1 + rnd.random() * args.spread for _ in range(args.count)]
+    requested = [0.0] * (args.count + 1)
+    with tempfile.TemporaryDirectory() as tmp:
+        scheduler = ReminderScheduler(Database(os.path.join(tmp, "reminders.db")), send, tick=args.tick)
+        await scheduler.open()
+
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        started = time.perf_counter()
+        for i, delay in enumerate(delays):
+            # Каждое третье напоминание — в личный чат, остальные в рабочие
+            chat_id = CHATS[i % len(CHATS)] if i % 3 else 10_000 + i % 5000
+            reminder = scheduler.schedule(chat_id, i % 50_000, f"user{i}", delay)
+            requested[reminder.id] = time.time() + delay
+            if i % 1000 == 0:
+                # Как и обработчики команд, не держим цикл событий дольше одной пачки
+                await asyncio.sleep(0)
+        elapsed = time.perf_counter() - started
+        memory = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+        print(f"Запланировано {args.count} напоминаний за {elapsed:.2f} с, "
+              f"память планировщика: {memory / args.count:.0f} байт/напоминание ({memory / 2 ** 20:.1f} МиБ)")
+
+        deadline = time.time() + args.spread + 5
+        while len(fired) < args.count and time.time() < deadline:
+            await asyncio.sleep(0.2)
+        await scheduler.close()
+
+    print(f"Сработало {len(fired)} из {args.count}, отправок (после объединения по тику и чату): {sends}")
+    print(f"Отклонение от запрошенного времени: p50={percentile(jitter, 50) * 1000:.1f} мс  "
+          f"p99={percentile(jitter, 99) * 1000:.1f} мс  max={max(jitter) * 1000:.1f} мс (тик {args.tick * 1000:.0f} мс)")
+
+
+async def bench_outbound(args) -> None:
+    # Предупреждения о каждом RetryAfter здесь ожидаемы
+    logging.getLogger("outbound").setLevel(logging.ERROR)
+    groups = [-1000000000000 - i for i in range(args.groups)]
+    privates = [100 + i for i in range(args.replies)]
+
+    async def run(limited: bool, random_flood: float = 0.0):
+        session = FakeSession(flood_control=True, scale=args.scale, latency=0.005, random_flood=random_flood)
+        limiter = None
+        if limited:
+            # Окна ускорены в scale раз, а запас токенов нет: ускоряем только пополнение
+            limiter = OutboundLimiter(global_rate=(30 - 5) * args.scale + 5,
+                                      group_per_minute=(20 - 3) * args.scale + 3,
+                                      private_rate=1 * args.scale)
+            session.middleware(limiter)
+        bot = fake_bot(session)
+        latencies: Dict[str, List[float]] = defaultdict(list)
+        failed = 0
+
+        async def send(kind: str, chat_id: int, text: str, delay: float) -> None:
+            nonlocal failed
+            await asyncio.sleep(delay)
+            started = time.perf_counter()
+            try:
+                if kind == "reminder":
+                    with outbound_priority(PRIORITY_BACKGROUND):
+                        await bot.send_message(chat_id, text)
+                else:
+                    await bot.send_chat_action(chat_id, "typing")
+                    await bot.send_message(chat_id, text)
+            except TelegramRetryAfter:
+                failed += 1
+                return
+            latencies[kind].append(time.perf_counter() - started)
+
+        jobs = [send("reminder", groups[i % len(groups)], f"напоминание {i}", 0) for i in range(args.reminders)]
+        # Ответы на команды приходят, пока очередь занята напоминаниями
+        jobs += [send("reply", chat_id, "ответ", 0.05 + i * 0.01) for i, chat_id in enumerate(privates)]
+        started = time.perf_counter()
+        await asyncio.gather(*jobs)
+        elapsed = time.perf_counter() - started
+
+        title = "С ограничителем" if limited else "Без ограничителя"
+        if random_flood:
+            title += f" и случайными 429 ({random_flood:.0%} запросов)"
+        print(f"{title}: {elapsed:.2f} с, ошибок 429 от API: {session.flood_errors}, потеряно сообщений: {failed}")
+        for kind, samples in latencies.items():
+            print(f"  {kind}: доставлено {len(samples)}, p50={percentile(samples, 50) * 1000:.0f} мс, "
+                  f"p99={percentile(samples, 99) * 1000:.0f} мс")
+        if limiter is not None:
+            print(f"  повторов после RetryAfter: {limiter.retries}, "
+                  f"отброшено send_chat_action: {limiter.dropped_chat_actions}")
+        print(f"  вызовы API: {dict(session.calls)}")
+        return bot, session, limiter, latencies, failed
+
+    if not args.check:
+        await run(limited=False)
+        await run(limited=True)
+        await run(limited=True, random_flood=0.05)
+        return
+
+    # Проверка: при случайных 429 ничего не теряется, ответы обгоняют напоминания,
+    # повторные индикаторы «печатает» не доходят до API
+    bot, session, limiter, latencies, failed = await run(limited=True, random_flood=0.05)
+    errors = []
+    delivered = {kind: len(samples) for kind, samples in latencies.items()}
+    if failed or delivered != {"reminder": args.reminders, "reply": args.replies}:
+        errors.append(f"потеряны сообщения: доставлено {delivered}, ошибок {failed}")
+    if not session.flood_errors or not limiter.retries:
+        errors.append("имитация не отдала ни одного 429: повторы не проверены")
+    reply_p99 = percentile(latencies["reply"], 99)
+    reminder_p50 = percentile(latencies["reminder"], 50)
+    if reply_p99 >= reminder_p50:
+        errors.append(f"ответы не обгоняют напоминания: p99 ответов {reply_p99 * 1000:.0f} мс, "
+                      f"p50 напоминаний {reminder_p50 * 1000:.0f} мс")
+    session.flood_control = False
+    actions, dropped = session.calls["SendChatAction"], limiter.dropped_chat_actions
+    for _ in range(5):
+        await bot.send_chat_action(privates[0], "typing")
+    if session.calls["SendChatAction"] - actions != 1 or limiter.dropped_chat_actions - dropped != 4:
+        errors.append(f"повторные send_chat_action не отброшены: отправлено "
+                      f"{session.calls['SendChatAction'] - actions} из 5")
+    for error in errors:
+        print(f"ОШИБКА: {error}")
+    if errors:
+        raise SystemExit(1)
+    print("Проверка пройдена")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    scenarios = parser.add_subparsers(dest="scenario", required=True)
+
+    storage = scenarios.add_parser("storage", help="запись в SQLite и задержка /crittask")
+    storage.add_argument("--count", type=int, default=1_000_000)
+    storage.add_argument("--batch-size", type=int, default=500)
+    storage.add_argument("--queries", type=int, default=10000)
+    storage.set_defaults(func=bench_storage)
+
+    memory = scenarios.add_parser("memory", help="объём памяти на одну задачу до и после TaskRecord")
+    memory.add_argument("--count", type=int, default=100_000)
+    memory.add_argument("--words", type=int, default=12, help="слов в тексте задачи")
+    memory.set_defaults(func=bench_memory)
+
+    search = scenarios.add_parser("search", help="задержка поиска в inline-режиме при росте архива")
+    search.add_argument("--counts", type=lambda value: [int(x) for x in value.split(",")],
+                        default=[10_000, 100_000, 300_000], help="размеры архива через запятую")
+    search.add_argument("--users", type=int, default=1000)
+    search.add_argument("--vocabulary", type=int, default=20000, help="размер словаря текстов")
+    search.add_argument("--queries", type=int, default=2000)
+    search.set_defaults(func=bench_search)
+
+    dispatcher = scenarios.add_parser("dispatcher", help="апдейты через настоящий dp из bot.py без сети")
+    dispatcher.add_argument("--sizes", type=lambda value: [int(x) for x in value.split(",")],
+                            default=[1000, 100_000, 1_000_000], help="размеры архива через запятую")
+    dispatcher.add_argument("--updates", type=int, default=20000, help="апдейтов на каждый размер архива")
+    dispatcher.add_argument("--users", type=int, default=1000)
+    dispatcher.add_argument("--log", action="store_true", help="оставить логирование INFO, как в работе")
+    dispatcher.add_argument("--output", default="benchmark-dispatcher.json", help="файл с результатами (JSON)")
+    dispatcher.set_defaults(func=bench_dispatcher)
+
+    metrics = scenarios.add_parser("metrics", help="накладные расходы middleware метрик на апдейт")
+    metrics.add_argument("--count", type=int, default=20000)
+    metrics.add_argument("--rounds", type=int, default=5)
+    metrics.set_defaults(func=bench_metrics)
+
+    paging = scenarios.add_parser("paging", help="задержка страницы списка задач в зависимости от её номера")
+    paging.add_argument("--count", type=int, default=300_000)
+    paging.add_argument("--users", type=int, default=1000)
+    paging.add_argument("--page-size", type=int, default=10)
+    paging.add_argument("--pages", type=lambda value: [int(x) for x in value.split(",")],
+                        default=[1, 10, 100, 1000, 10000], help="номера страниц через запятую")
+    paging.add_argument("--queries", type=int, default=200)
+    paging.set_defaults(func=bench_paging)
+
+    logs = scenarios.add_parser("logging", help="блокировка цикла событий записью лога при всплеске сообщений")
+    logs.add_argument("--count", type=int, default=10000)
+    logs.add_argument("--batch", type=int, default=100, help="апдейтов в одной пачке getUpdates")
+    logs.add_argument("--every", type=int, default=100, help="сводка в INFO раз в столько задач")
+    logs.set_defaults(func=bench_logging)
+
+    tracker = scenarios.add_parser("tracker", help="синхронизация с имитацией Yandex Tracker: скорость и число запросов")
+    tracker.add_argument("--count", type=int, default=2000, help="задач в архиве")
+    tracker.add_argument("--touched", type=int, default=200, help="сколько задач изменить в Tracker")
+    tracker.add_argument("--lookups", type=int, default=200, help="сколько статусов запросить через кэш")
+    tracker.add_argument("--batch-size", type=int, default=50)
+    tracker.add_argument("--page-size", type=int, default=100)
+    tracker.add_argument("--concurrency", type=int, default=8)
+    tracker.add_argument("--rate", type=float, default=1000.0, help="лимит клиента, запросов в секунду")
+    tracker.add_argument("--server-rate", type=float, default=0.0, help="лимит имитации, сверх него 429")
+    tracker.add_argument("--latency", type=float, default=0.005, help="задержка ответа имитации, в секундах")
+    tracker.add_argument("--cache-ttl", type=float, default=60.0)
+    tracker.set_defaults(func=bench_tracker)
+
+    reminders = scenarios.add_parser("reminders", help="нагрузка на планировщик напоминаний")
+    reminders.add_argument("--count", type=int, default=100_000)
+    reminders.add_argument("--spread", type=float, default=10.0, help="разброс срабатываний, в секундах")
+    reminders.add_argument("--tick", type=float, default=0.1)
+    reminders.set_defaults(func=bench_reminders)
+
+    outbound = scenarios.add_parser("outbound", help="всплеск исходящих сообщений против имитации flood control")
+    outbound.add_argument("--reminders", type=int, default=300)
+    outbound.add_argument("--groups", type=int, default=10)
+    outbound.add_argument("--replies", type=int, default=30)
+    outbound.add_argument("--scale", type=float, default=10.0, help="ускорение лимитов и окон времени")
+    outbound.add_argument("--check", action="store_true",
+                          help="проверить доставку, приоритет и отбрасывание send_chat_action (код выхода 1 при ошибке)")
+    outbound.set_defaults(func=bench_outbound)
+
+    args = parser.parse_args()
+    asyncio.run(args.func(args))
+
+
+if __name__ == "__main__":
+    main()
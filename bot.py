@@ -1,10 +1,16 @@
 import os
+import html
+import itertools
+import math
+import time
+import signal
+import asyncio
 import logging
-from typing import List, Tuple
-import datetime
+from typing import Callable, FrozenSet, List, NamedTuple, Optional, Tuple
 
 from aiogram import Bot, Dispatcher, types, F
 from aiogram.filters import Command
+from aiogram.filters.callback_data import CallbackData
 from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.utils.keyboard import ReplyKeyboardBuilder, InlineKeyboardBuilder
 from pydantic_settings import BaseSettings, SettingsConfigDict
@@ -13,16 +19,20 @@ from aiogram.enums import ParseMode, ChatType
 from aiogram.exceptions import TelegramBadRequest
 from aiogram.fsm.context import FSMContext
 
+from metrics import MetricsMiddleware, MetricsRegistry, MetricsServer, SlowUpdateProfiler
+from outbound import PRIORITY_BACKGROUND, OutboundLimiter, outbound_priority
+from reminders import Reminder, ReminderScheduler
+from render_cache import RenderCache
+from logging_setup import setup_logging
+from task_archive import Database, TaskArchive
+from task_classifier import TaskClassifier
+from task_search import SearchQuery, TextIndex
+from task_stats import TaskStats
+from task_store import RetentionPolicy, TaskKey, TaskRecord, TaskStore
+from tracker_sync import TrackerClient, TrackerError, TrackerSync
+from webhook import WebhookServer
+
 
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s [%(levelname)s] %(message)s',
-    handlers=[
-        logging.FileHandler('bot.log', encoding='utf-8'),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger(__name__)
 
 
@@ -31,7 +41,71 @@ class Settings(BaseSettings):
     TELEGRAM_TOKEN: str = Field(..., alias="TELEGRAM_TOKEN")
     CHAT_ID: str = "-1002481390495"  # Основной чат
     MONITOR_CHATS: str = "-1002224942388,-1002481390495"  # Чаты для мониторинга
-    # Параметры для будущего расширения (например, база данных)
+    # Хэштеги, по которым сообщения из MONITOR_CHATS попадают в архив
+    TRACKED_TAGS: str = "#Критичный,#Блокер,#Крит_Блокер,#КритБлокер,#Релиз,#Приемка,#Быстрый_Тест"
+    # Режим получения апдейтов: polling или webhook
+    BOT_MODE: str = "polling"
+    WEBHOOK_URL: str = ""  # Публичный адрес вебхука; пустой — не регистрировать в Telegram
+    WEBHOOK_PATH: str = "/webhook"
+    WEBHOOK_HOST: str = "0.0.0.0"
+    WEBHOOK_PORT: int = 8080
+    WEBHOOK_SECRET: str = ""  # Проверяется в заголовке X-Telegram-Bot-Api-Secret-Token
+    WEBHOOK_MAX_CONCURRENCY: int = 32  # Одновременно обрабатываемых апдейтов
+    WEBHOOK_MAX_PENDING: int = 1000  # Сверх этого числа апдейты отклоняются с 503
+    WEBHOOK_DRAIN_TIMEOUT: float = 30.0  # Сколько ждать завершения обработчиков при остановке
+    # Постоянный архив задач (SQLite)
+    DATABASE_PATH: str = "tasks.db"
+    ARCHIVE_BATCH_SIZE: int = 500  # Размер пачки для записи в базу
+    ARCHIVE_FLUSH_INTERVAL: float = 1.0  # Максимальная задержка записи, в секундах
+    ARCHIVE_WARM_DAYS: int = 30  # Глубина горячего окна, загружаемого в память при старте
+    ARCHIVE_WARM_LIMIT: int = 100000  # Максимум задач в горячем окне
+    # Ограничения архива в памяти (0 — без ограничения); в SQLite задачи остаются
+    TASK_TEXT_LIMIT: int = 1000  # Сколько символов текста задачи держать в памяти
+    RETENTION_MAX_AGE_DAYS: int = 30
+    RETENTION_MAX_PER_TAG: int = 0
+    RETENTION_MAX_MB: int = 256
+    # Ограничение исходящих сообщений (лимиты Telegram)
+    OUTBOUND_GLOBAL_RATE: float = 30.0  # сообщений в секунду на весь бот
+    OUTBOUND_GROUP_PER_MINUTE: float = 20.0  # сообщений в минуту в одну группу
+    OUTBOUND_PRIVATE_RATE: float = 1.0  # сообщений в секунду в личный чат
+    TASK_PAGE_SIZE: int = 10  # Задач на странице в списках /task, /crittask, /bloker, /releasetask
+    RENDER_CACHE_SIZE: int = 5000  # Сколько готовых ответов со списками задач держать в кэше
+    # Аналитика /stats
+    STATS_DAYS: int = 30  # Глубина почасовых и суточных трендов
+    STATS_TOP: int = 10  # Сколько авторов показывать в топе
+    # Поиск задач в inline-режиме
+    INLINE_PAGE_SIZE: int = 20  # Результатов на страницу (не больше 50)
+    INLINE_CACHE_TIME: int = 10  # Сколько секунд Telegram кэширует ответ на запрос
+    # Напоминания
+    REMINDER_TICK: float = 1.0  # Точность срабатывания, в секундах
+    REMINDER_MAX_PER_USER: int = 20
+    # Метрики и профилирование
+    METRICS_HOST: str = "127.0.0.1"
+    METRICS_PORT: int = 9102  # 0 — не открывать /metrics
+    SLOW_UPDATE_THRESHOLD: float = 0.0  # Профилировать апдейты дольше стольких секунд (0 — выключено)
+    PROFILER_INTERVAL: float = 0.01  # Период сэмплирования стека, в секундах
+    # Синхронизация задач с Yandex Tracker (/external); без TRACKER_TOKEN и TRACKER_QUEUE выключена
+    TRACKER_URL: str = "https://api.tracker.yandex.net"
+    TRACKER_TOKEN: str = ""  # OAuth-токен
+    TRACKER_ORG_ID: str = ""
+    TRACKER_CLOUD_ORG: bool = False  # Организация Yandex Cloud (X-Cloud-Org-ID), а не Яндекс 360
+    TRACKER_QUEUE: str = ""  # Ключ очереди, например SUPPORT
+    TRACKER_SYNC_INTERVAL: float = 60.0  # Период синхронизации, в секундах (0 — только /external sync)
+    TRACKER_SYNC_DAYS: int = 7  # Задачи архива не старше стольких дней переносятся в Tracker
+    TRACKER_BATCH_SIZE: int = 50  # Задач в пачке на создание
+    TRACKER_PAGE_SIZE: int = 100  # Задач на странице при получении изменений
+    TRACKER_CONCURRENCY: int = 8  # Одновременных запросов к API
+    TRACKER_RATE: float = 20.0  # Запросов в секунду
+    TRACKER_CACHE_TTL: float = 60.0  # Сколько секунд статус задачи берётся из кэша без запроса
+    # Логирование: запись в файл идёт в фоновом потоке
+    LOG_LEVEL: str = "INFO"
+    LOG_FILE: str = "bot.log"  # Пустой — только консоль
+    LOG_JSON: bool = False  # Записи в виде JSON-строк
+    LOG_MAX_MB: int = 10  # Ротация по размеру файла
+    LOG_ROTATE_WHEN: str = ""  # Ротация по времени вместо размера: midnight, H, W0...
+    LOG_BACKUPS: int = 10  # Сколько сжатых файлов хранить
+    LOG_TASK_EVERY: int = 100  # Сводка о собранных задачах в INFO раз в столько задач (каждая — в DEBUG), 0 — не писать
+    # Параметры для будущего расширения
     DATABASE_PASSWORD: str = ""
     API_KEY: str = ""
 
@@ -39,6 +113,10 @@ class Settings(BaseSettings):
     def target_chats(self) -> List[str]:
         return [chat.strip() for chat in self.MONITOR_CHATS.split(",") if chat.strip()]
 
+    @property
+    def tracked_tags(self) -> List[str]:
+        return [tag.strip() for tag in self.TRACKED_TAGS.split(",") if tag.strip()]
+
     model_config = SettingsConfigDict(
         env_file=".env",
         env_file_encoding="utf-8",
@@ -53,6 +131,16 @@ except Exception as e:
     logger.critical(f"Ошибка загрузки настроек: {e}")
     raise
 
+# Настройка логирования
+setup_logging(
+    path=config.LOG_FILE or None,
+    level=config.LOG_LEVEL,
+    json_format=config.LOG_JSON,
+    max_bytes=config.LOG_MAX_MB * 1024 * 1024,
+    when=config.LOG_ROTATE_WHEN,
+    backup_count=config.LOG_BACKUPS
+)
+
 bot = Bot(
     token=config.TELEGRAM_TOKEN,
     parse_mode=ParseMode.HTML,
@@ -60,6 +148,14 @@ bot = Bot(
 )
 dp = Dispatcher(storage=MemoryStorage())
 
+# Все исходящие запросы проходят через ограничитель частоты с очередями приоритетов
+outbound_limiter = OutboundLimiter(
+    global_rate=config.OUTBOUND_GLOBAL_RATE,
+    group_per_minute=config.OUTBOUND_GROUP_PER_MINUTE,
+    private_rate=config.OUTBOUND_PRIVATE_RATE
+)
+bot.session.middleware(outbound_limiter)
+
 
 # Обновление списка команд для расширенного функционала
 COMMANDS: List[Tuple[str, str]] = [
@@ -71,15 +167,15 @@ COMMANDS: List[Tuple[str, str]] = [
     ("bloker", "Блокирующие задачи"),
     ("releasetask", "Задачи для релиза"),
     ("admin", "Панель администратора"),
-    ("reminder", "Установить напоминание"),
+    ("reminder", "Напоминания: установить, список, отмена"),
     ("stats", "Аналитика задач"),
-    ("external", "Интеграция с внешними сервисами"),
+    ("external", "Синхронизация с Yandex Tracker"),
     ("settings", "Настройки пользователя")
 ]
 
 
 # Функция генерации основной клавиатуры
-def get_main_keyboard(user_username: str) -> types.ReplyKeyboardMarkup:
+def build_main_keyboard() -> types.ReplyKeyboardMarkup:
     builder = ReplyKeyboardBuilder()
     for cmd, _ in COMMANDS:
         builder.add(types.KeyboardButton(text=f"/{cmd}"))
@@ -87,6 +183,15 @@ def get_main_keyboard(user_username: str) -> types.ReplyKeyboardMarkup:
     return builder.as_markup(resize_keyboard=True)
 
 
+# Клавиатура и текст справки зависят только от COMMANDS, поэтому строятся один раз
+MAIN_KEYBOARD = build_main_keyboard()
+HELP_TEXT = "<b>Доступные команды:</b>\n\n" + "\n".join(f"/{cmd} - {desc}" for cmd, desc in COMMANDS)
+
+
+def get_main_keyboard(user_username: str) -> types.ReplyKeyboardMarkup:
+    return MAIN_KEYBOARD
+
+
 # Обработчик команды /start
 @dp.message(Command("start"))
 async def cmd_start(message: types.Message):
@@ -98,10 +203,7 @@ async def cmd_start(message: types.Message):
 # Обработчик команды /help
 @dp.message(Command("help"))
 async def cmd_help(message: types.Message):
-    help_text = "<b>Доступные команды:</b>\n\n" + "\n".join(
-        f"/{cmd} - {desc}" for cmd, desc in COMMANDS
-    )
-    await message.answer(help_text)
+    await message.answer(HELP_TEXT)
 
 
 # Обработчик команды /me
@@ -119,67 +221,170 @@ async def cmd_me(message: types.Message):
     await message.answer(user_info)
 
 
-# Добавляем глобальный архив критических задач
-CriticalTasksArchive = []
-
-# Новый обработчик для сбора сообщений с хэштегом "#Критичный" из чатов MONITOR_CHATS
-@dp.message(lambda message: message.chat.id in list(map(int, config.target_chats)) and message.text and "#Критичный" in message.text)
-async def monitor_critical_messages(message: types.Message):
-    task = {
-        "text": message.text,
-        "link": f"https://t.me/c/{str(message.chat.id).replace('-100','')}/{message.message_id}",
-        "date": message.date.strftime("%d.%m.%Y %H:%M"),
-        "user_id": message.from_user.id if message.from_user else None,
-        "username": message.from_user.username if message.from_user and message.from_user.username else None
-    }
-    CriticalTasksArchive.append(task)
-    logger.info(f"Добавлена критическая задача из чата {message.chat.id}: {message.text[:30]}...")
-
-
-# Функция для получения задач по тегу
-async def get_tasks_by_tag(tag: str, user_id: int = None) -> List[str]:
-    tasks = []
-    for task in CriticalTasksArchive:
-        if tag in task["text"]:
-            if user_id is None or task.get("user_id") == user_id:
-                tasks.append(task["text"])
-    return tasks[:10]  # Возвращаем только первые 10 задач
-
-
-# Изменяю функцию fetch_critical_tasks для возврата реальных задач из CriticalTasksArchive
-async def fetch_critical_tasks(user_id: int = None) -> List[dict]:
-    # Фильтруем задачи по user_id, если он указан
-    filtered_tasks = CriticalTasksArchive
-    if user_id is not None:
-        filtered_tasks = [task for task in CriticalTasksArchive if task.get("user_id") == user_id]
-    
-    # Сортируем задачи по дате в обратном порядке и берем последние 10
-    sorted_tasks = sorted(filtered_tasks, key=lambda x: datetime.datetime.strptime(x['date'], "%d.%m.%Y %H:%M"), reverse=True)[:10]
-    return sorted_tasks
-
-
-# Новая функция для выборки блокирующих задач с тегом #Блокер
-async def fetch_blocker_tasks(user_id: int = None) -> List[dict]:
-    # Фильтруем задачи по тегу и user_id, если он указан
-    filtered_tasks = [task for task in CriticalTasksArchive if "#Блокер" in task['text']]
-    if user_id is not None:
-        filtered_tasks = [task for task in filtered_tasks if task.get("user_id") == user_id]
-    
-    sorted_tasks = sorted(filtered_tasks, key=lambda x: datetime.datetime.strptime(x['date'], "%d.%m.%Y %H:%M"), reverse=True)[:10]
-    return sorted_tasks
-
-
-# Новая функция для выборки релизных задач с тегами ['#Релиз', '#Приемка', '#Быстрый_Тест']
-async def fetch_release_tasks(user_id: int = None) -> List[dict]:
-    release_tags = ["#Релиз", "#Приемка", "#Быстрый_Тест"]
-    # Фильтруем задачи по тегам
-    filtered_tasks = [task for task in CriticalTasksArchive if any(tag in task['text'] for tag in release_tags)]
-    # Дополнительно фильтруем по user_id, если он указан
-    if user_id is not None:
-        filtered_tasks = [task for task in filtered_tasks if task.get("user_id") == user_id]
-    
-    sorted_tasks = sorted(filtered_tasks, key=lambda x: datetime.datetime.strptime(x['date'], "%d.%m.%Y %H:%M"), reverse=True)[:10]
-    return sorted_tasks
+# Глобальный архив задач с индексами по тегу, пользователю и чату
+CriticalTasksArchive = TaskStore(RetentionPolicy(
+    max_age=config.RETENTION_MAX_AGE_DAYS * 86400,
+    max_per_tag=config.RETENTION_MAX_PER_TAG,
+    max_bytes=config.RETENTION_MAX_MB * 1024 * 1024
+), text_index=TextIndex())
+# Одно соединение с базой на архив, напоминания и синхронизацию с Tracker
+database = Database(config.DATABASE_PATH)
+# Постоянное хранилище: все задачи пишутся в SQLite, в памяти держится горячее окно
+task_archive = TaskArchive(
+    database,
+    batch_size=config.ARCHIVE_BATCH_SIZE,
+    flush_interval=config.ARCHIVE_FLUSH_INTERVAL,
+    text_limit=config.TASK_TEXT_LIMIT
+)
+
+# Счётчики для /stats: обновляются при каждой новой задаче, при старте восстанавливаются из архива
+task_stats = TaskStats(days=config.STATS_DAYS, top=config.STATS_TOP)
+
+# Теги, по которым команды выбирают задачи
+CRITICAL_TAG = "#Критичный"
+BLOCKER_TAG = "#Блокер"
+RELEASE_TAGS = ("#Релиз", "#Приемка", "#Быстрый_Тест")
+
+# Фильтр собирается один раз при старте: множество чатов и регулярное выражение по всем тегам
+task_classifier = TaskClassifier(map(int, config.target_chats), config.tracked_tags)
+
+ingest_counter = itertools.count(1)
+
+
+# Сбор сообщений с отслеживаемыми хэштегами из чатов MONITOR_CHATS
+@dp.message(task_classifier)
+async def monitor_critical_messages(message: types.Message, tags: FrozenSet[str]):
+    task = TaskRecord(
+        chat_id=message.chat.id,
+        message_id=message.message_id,
+        timestamp=int(message.date.timestamp()),
+        text=message.text,
+        tags=tags,
+        user_id=message.from_user.id if message.from_user else None,
+        username=message.from_user.username if message.from_user and message.from_user.username else None,
+        text_limit=config.TASK_TEXT_LIMIT
+    )
+    if CriticalTasksArchive.add(task):
+        task_archive.enqueue(task, message.text)
+        task_stats.add(task)
+    # Горячий путь: строка собирается, только если DEBUG включён
+    logger.debug("Добавлена задача %s из чата %s: %.30s...", " ".join(sorted(tags)), message.chat.id, message.text)
+    collected = next(ingest_counter)
+    if config.LOG_TASK_EVERY and collected % config.LOG_TASK_EVERY == 0:
+        logger.info("Собрано задач с запуска: %d, последняя из чата %s", collected, message.chat.id)
+
+
+def highlight_crit_blocker(text: str) -> str:
+    return text.replace('#Крит_Блокер', '🔥').replace('#КритБлокер', '🔥')
+
+
+# Описание списка задач для команды: code — короткий идентификатор списка в callback_data
+class TaskList(NamedTuple):
+    code: str
+    tags: Optional[Tuple[str, ...]]  # None — все задачи пользователя
+    title: str
+    empty_text: str
+    transform: Optional[Callable[[str], str]] = None
+
+
+CRITICAL_TASKS = TaskList("c", (CRITICAL_TAG,), "🚨 <b>Критические задачи:</b>\n",
+                          "✅ Активных критических задач не найдено!", highlight_crit_blocker)
+BLOCKER_TASKS = TaskList("b", (BLOCKER_TAG,), "🚨 <b>Блокирующие задачи:</b>\n", "✅ Активных блокирующих задач не найдено!")
+RELEASE_TASKS = TaskList("r", RELEASE_TAGS, "🚀 <b>Релизные задачи:</b>\n", "📦 Нет активных релизных задач")
+ALL_TASKS = TaskList("t", None, "📋 <b>Все ваши задачи:</b>\n", "📋 У вас нет активных задач")
+TASK_LISTS = {task_list.code: task_list for task_list in (CRITICAL_TASKS, BLOCKER_TASKS, RELEASE_TASKS, ALL_TASKS)}
+
+
+class TaskPage(CallbackData, prefix="tp"):
+    """Кнопка листания: вместо номера страницы передаётся ключ крайней показанной задачи.
+
+    Самый длинный вариант (tp:c:1:9999:<user_id>:<время>:-100xxxxxxxxxx:<message_id>)
+    укладывается в 64 байта callback_data.
+    """
+    kind: str  # TaskList.code
+    newer: bool  # True — к более новым задачам (◀), False — к более старым (▶)
+    page: int
+    user: int  # Листать может только тот, кто вызвал команду; 0 — без пользователя
+    timestamp: int
+    chat_id: int
+    message_id: int
+
+
+# Страница задач по ключу соседней задачи (keyset): стоимость не зависит от номера страницы.
+# Берём на одну задачу больше, чем показываем, чтобы знать, есть ли следующая страница.
+# Задачи, вытесненные из памяти, дочитываются из архива тем же ключом
+async def fetch_task_page(task_list: TaskList, user_id: Optional[int], before: Optional[TaskKey] = None,
+                          after: Optional[TaskKey] = None) -> Tuple[List[TaskRecord], bool, bool]:
+    """Задачи страницы от новых к старым, есть ли задачи новее и есть ли старее."""
+    size = config.TASK_PAGE_SIZE
+    tasks = CriticalTasksArchive.latest(tags=task_list.tags, user_id=user_id, limit=size + 1,
+                                        before=before, after=after)
+    horizon = CriticalTasksArchive.evicted_until
+    if after is not None:
+        # Якорь не новее вытесненных задач: часть задач между ним и памятью есть только в архиве
+        if after[0] <= horizon:
+            archived = await task_archive.page(task_list.tags, user_id, size + 1, after=after)
+            merged = {task.key: task for task in archived + tasks}
+            tasks = [merged[key] for key in sorted(merged)[:size + 1]][::-1]
+        return tasks[-size:], len(tasks) > size, True
+    if horizon:
+        # Ниже горизонта вытеснения память неполна: остаток страницы берём из архива
+        tasks = list(itertools.takewhile(lambda task: task.timestamp > horizon, tasks))
+    if len(tasks) <= size and horizon:
+        tasks += await task_archive.page(task_list.tags, user_id, size + 1 - len(tasks),
+                                         before=tasks[-1].key if tasks else before)
+    return tasks[:size], before is not None, len(tasks) > size
+
+
+# Готовые ответы со списками задач: пересобираются только при изменении задач пользователя с нужными тегами
+render_cache = RenderCache(maxsize=config.RENDER_CACHE_SIZE)
+
+
+# Текст и клавиатура со ссылками и кнопками листания для страницы списка задач
+def render_task_list(task_list: TaskList, user_id: Optional[int], tasks: List[TaskRecord], page: int = 1,
+                     has_newer: bool = False, has_older: bool = False) -> Tuple[str, types.InlineKeyboardMarkup]:
+    builder = InlineKeyboardBuilder()
+    title = task_list.title
+    if has_newer or has_older:
+        title = f"{title.rstrip()} <i>стр. {page}</i>\n"
+    response = [title]
+    first = (page - 1) * config.TASK_PAGE_SIZE
+    for idx, task in enumerate(tasks, first + 1):
+        task_text = html.escape(task.text[:150])
+        if task_list.transform:
+            task_text = task_list.transform(task_text)
+        response.append(
+            f"{idx}. <b>Задача {idx}</b>\n"
+            f"📅 {task.date}\n"
+            f"📝 {task_text}..."
+        )
+        builder.button(text=f"Задача {idx}", url=task.link)
+    builder.adjust(2)
+    navigation = []
+    if has_newer:
+        navigation.append(types.InlineKeyboardButton(text="◀", callback_data=TaskPage(
+            kind=task_list.code, newer=True, page=page - 1, user=user_id or 0, timestamp=tasks[0].timestamp,
+            chat_id=tasks[0].chat_id, message_id=tasks[0].message_id).pack()))
+    if has_older:
+        navigation.append(types.InlineKeyboardButton(text="▶", callback_data=TaskPage(
+            kind=task_list.code, newer=False, page=page + 1, user=user_id or 0, timestamp=tasks[-1].timestamp,
+            chat_id=tasks[-1].chat_id, message_id=tasks[-1].message_id).pack()))
+    if navigation:
+        builder.row(*navigation)
+    return "\n".join(response), builder.as_markup()
+
+
+# Первая страница списка из кэша или, если задачи изменились, заново
+async def get_task_list_reply(task_list: TaskList, user_id: Optional[int]
+                              ) -> Tuple[str, Optional[types.InlineKeyboardMarkup]]:
+    version = CriticalTasksArchive.version(tags=task_list.tags, user_id=user_id)
+    reply = render_cache.get((task_list.code, user_id), version)
+    if reply is None:
+        tasks, has_newer, has_older = await fetch_task_page(task_list, user_id)
+        reply = render_task_list(task_list, user_id, tasks, 1, has_newer, has_older) if tasks else (
+            task_list.empty_text, None)
+        render_cache.put((task_list.code, user_id), version, reply)
+    return reply
 
 
 # Обработчик команды /crittask
@@ -189,48 +394,21 @@ async def cmd_critical_tasks(message: types.Message):
         await bot.send_chat_action(chat_id=message.chat.id, action="typing")
         # Получаем задачи только для текущего пользователя
         user_id = message.from_user.id if message.from_user else None
-        tasks = await fetch_critical_tasks(user_id)
-        
-        if not tasks:
-            await message.answer("✅ Активных критических задач не найдено!")
-            return
-
-        builder = InlineKeyboardBuilder()
-        response = ["🚨 <b>Критические задачи:</b>\n"]
-        for idx, task in enumerate(tasks, 1):
-            task_text = task['text'].replace('#Крит_Блокер', '🔥').replace('#КритБлокер', '🔥')
-            response.append(
-                f"{idx}. <b>Задача {idx}</b>\n"
-                f"📅 {task['date']}\n"
-                f"📝 {task_text[:150]}..."
-            )
-            builder.button(text=f"Задача {idx}", url=task['link'])
-
-        builder.adjust(2)
-        await message.answer(
-            "\n".join(response),
-            reply_markup=builder.as_markup(),
-            parse_mode=ParseMode.HTML
-        )
+        text, markup = await get_task_list_reply(CRITICAL_TASKS, user_id)
+        await message.answer(text, reply_markup=markup, parse_mode=ParseMode.HTML)
 
     except Exception as e:
         logger.error(f"Ошибка в cmd_critical_tasks: {e}")
         await message.answer("⚠️ Произошла ошибка при получении критических задач!")
 
 
-# Обработчик команды /task
+# Обработчик команды /task: все задачи пользователя с любыми отслеживаемыми тегами
 @dp.message(Command("task"))
 async def cmd_all_tasks(message: types.Message):
     try:
         user_id = message.from_user.id if message.from_user else None
-        tasks = await get_tasks_by_tag("#ВсеЗадачи", user_id)
-        
-        if not tasks:
-            await message.answer("📋 У вас нет активных задач")
-            return
-            
-        response = "📋 <b>Все ваши задачи:</b>\n" + "\n".join(f"• {task[:150]}..." for task in tasks)
-        await message.answer(response)
+        text, markup = await get_task_list_reply(ALL_TASKS, user_id)
+        await message.answer(text, reply_markup=markup, parse_mode=ParseMode.HTML)
     except Exception as e:
         logger.error(f"Ошибка в cmd_all_tasks: {e}")
         await message.answer("⚠️ Произошла ошибка при получении задач!")
@@ -243,33 +421,44 @@ async def cmd_release_tasks(message: types.Message):
         await bot.send_chat_action(chat_id=message.chat.id, action="typing")
         # Получаем задачи только для текущего пользователя
         user_id = message.from_user.id if message.from_user else None
-        tasks = await fetch_release_tasks(user_id)
-        
-        if not tasks:
-            await message.answer("📦 Нет активных релизных задач")
-            return
-
-        builder = InlineKeyboardBuilder()
-        response = ["🚀 <b>Релизные задачи:</b>\n"]
-        for idx, task in enumerate(tasks, 1):
-            response.append(
-                f"{idx}. <b>Задача {idx}</b>\n"
-                f"📅 {task['date']}\n"
-                f"📝 {task['text'][:150]}..."
-            )
-            builder.button(text=f"Задача {idx}", url=task['link'])
-
-        builder.adjust(2)
-        await message.answer(
-            "\n".join(response),
-            reply_markup=builder.as_markup(),
-            parse_mode=ParseMode.HTML
-        )
+        text, markup = await get_task_list_reply(RELEASE_TASKS, user_id)
+        await message.answer(text, reply_markup=markup, parse_mode=ParseMode.HTML)
     except Exception as e:
         logger.error(f"Ошибка в cmd_release_tasks: {e}")
         await message.answer("⚠️ Произошла ошибка при получении релизных задач!")
 
 
+# Листание списков задач: сообщение со списком редактируется на месте
+@dp.callback_query(TaskPage.filter())
+async def on_task_page(callback: types.CallbackQuery, callback_data: TaskPage):
+    if callback_data.user and callback_data.user != callback.from_user.id:
+        await callback.answer("Это список задач другого пользователя", show_alert=True)
+        return
+    task_list = TASK_LISTS.get(callback_data.kind)
+    if task_list is None or callback.message is None:
+        await callback.answer()
+        return
+    user_id = callback_data.user or None
+    key = (callback_data.timestamp, callback_data.chat_id, callback_data.message_id)
+    if callback_data.newer:
+        tasks, has_newer, has_older = await fetch_task_page(task_list, user_id, after=key)
+    else:
+        tasks, has_newer, has_older = await fetch_task_page(task_list, user_id, before=key)
+    if not tasks:
+        # Задачи за якорем удалены или списка больше нет
+        await callback.answer("Больше задач нет")
+        return
+    page = callback_data.page if has_newer else 1
+    text, markup = render_task_list(task_list, user_id, tasks, page, has_newer, has_older)
+    try:
+        await callback.message.edit_text(text, reply_markup=markup, parse_mode=ParseMode.HTML)
+    except TelegramBadRequest as e:
+        # Повторное нажатие на ту же кнопку: текст не изменился
+        if "message is not modified" not in str(e):
+            raise
+    await callback.answer()
+
+
 # Новые команды для расширения функционала
 
 @dp.message(Command("admin"))
@@ -279,13 +468,64 @@ async def cmd_admin(message: types.Message):
         return
     await message.answer("Добро пожаловать в панель администратора. Функционал в разработке.")
 
+# Отправка напоминаний, сработавших в одном чате в один тик, одним сообщением
+async def send_reminders(chat_id: int, reminders: List[Reminder]):
+    mentions = []
+    for reminder in reminders:
+        if reminder.username:
+            mentions.append(f"<b>@{reminder.username}</b>")
+        else:
+            mentions.append(f'<a href="tg://user?id={reminder.user_id}">напоминание</a>')
+    # Не больше 50 упоминаний в сообщении, чтобы уложиться в лимит длины текста.
+    # Напоминания пропускают вперёд ответы на команды
+    with outbound_priority(PRIORITY_BACKGROUND):
+        for start in range(0, len(mentions), 50):
+            await bot.send_message(
+                chat_id=chat_id,
+                text=f"{', '.join(mentions[start:start + 50])}, не забудь проверить задачи/дашборд/доску",
+                parse_mode=ParseMode.HTML
+            )
+
+
+reminder_scheduler = ReminderScheduler(database, send_reminders, tick=config.REMINDER_TICK)
+
+
 @dp.message(Command("reminder"))
 async def cmd_reminder(message: types.Message):
     try:
         parts = message.text.split()
         if len(parts) < 2:
-            await message.answer("Пожалуйста, укажите время в минутах от 1 до 60. Пример: /reminder 10")
+            await message.answer(
+                "Пожалуйста, укажите время в минутах от 1 до 60. Пример: /reminder 10\n"
+                "Список напоминаний: /reminder list\n"
+                "Отмена: /reminder cancel &lt;номер&gt;"
+            )
             return
+
+        user_id = message.from_user.id
+        if parts[1] == "list":
+            reminders = reminder_scheduler.for_user(user_id)
+            if not reminders:
+                await message.answer("⏰ У вас нет активных напоминаний")
+                return
+            now = time.time()
+            lines = ["⏰ <b>Ваши напоминания:</b>"]
+            for reminder in reminders:
+                left = math.ceil(max(0.0, reminder.fire_at - now) / 60)
+                lines.append(f"#{reminder.id} — через {left} мин.")
+            await message.answer("\n".join(lines))
+            return
+
+        if parts[1] == "cancel":
+            if len(parts) < 3 or not parts[2].lstrip("#").isdigit():
+                await message.answer("Укажите номер напоминания. Пример: /reminder cancel 3")
+                return
+            if reminder_scheduler.cancel(user_id, int(parts[2].lstrip("#"))):
+                await message.answer("Напоминание отменено.")
+            else:
+                await message.answer("Напоминание с таким номером не найдено.")
+            return
+
         try:
             minutes = int(parts[1])
         except ValueError:
@@ -296,44 +536,132 @@ async def cmd_reminder(message: types.Message):
             await message.answer("Время должно быть в диапазоне от 1 до 60 минут.")
             return
 
-        # Сохраняем ID пользователя и чата для отправки напоминания
-        user_id = message.from_user.id
-        chat_id = message.chat.id
-        
-        await message.answer(f"Напоминание установлено. Я напомню через {minutes} минут(ы).")
-
-        async def send_reminder():
-            import asyncio
-            await asyncio.sleep(minutes * 60)
-            try:
-                # Отправляем напоминание в тот же чат и тому же пользователю
-                await bot.send_message(
-                    chat_id=chat_id,
-                    text=f"<b>@{message.from_user.username}</b>, не забудь проверить задачи/дашборд/доску",
-                    parse_mode=ParseMode.HTML
-                )
-            except Exception as e:
-                logger.error(f"Ошибка отправки напоминания: {e}")
-
-        import asyncio
-        asyncio.create_task(send_reminder())
+        if len(reminder_scheduler.for_user(user_id)) >= config.REMINDER_MAX_PER_USER:
+            await message.answer("Слишком много активных напоминаний. Отмените одно из них: /reminder list")
+            return
+
+        # Планировщик хранит только ID чата и пользователя, а не всё сообщение
+        reminder = reminder_scheduler.schedule(
+            chat_id=message.chat.id,
+            user_id=user_id,
+            username=message.from_user.username,
+            delay=minutes * 60
+        )
+        await message.answer(f"Напоминание #{reminder.id} установлено. Я напомню через {minutes} минут(ы).")
     except Exception as e:
         logger.error(f"Ошибка в cmd_reminder: {e}")
         await message.answer("⚠️ Произошла ошибка при установке напоминания!")
 
+SPARK_BARS = "▁▂▃▄▅▆▇█"
+
+
+def sparkline(values: List[int]) -> str:
+    peak = max(values, default=0)
+    if not peak:
+        return SPARK_BARS[0] * len(values)
+    return "".join(SPARK_BARS[(value * (len(SPARK_BARS) - 1) + peak - 1) // peak] for value in values)
+
+
+# Отчёт собирается из готовых счётчиков и корзин, архив при этом не просматривается
+def render_stats(stats: TaskStats, now: int) -> str:
+    lines = [
+        "📊 <b>Аналитика задач</b>\n",
+        f"Всего задач: <b>{stats.total}</b>",
+        f"За 24 ч: {stats.last_hours(now, 24)} · за 7 дн: {stats.last_hours(now, 7 * 24)} · "
+        f"за {stats.days} дн: {stats.last_hours(now, stats.days * 24)}",
+        "\n<b>По тегам:</b>",
+    ]
+    lines += [f"{tag}: {count}" for tag, count in sorted(stats.tags.items(), key=lambda item: (-item[1], item[0]))]
+    lines.append("\n<b>По чатам:</b>")
+    lines += [f"{chat_id}: {count}" for chat_id, count in sorted(stats.chats.items(), key=lambda item: (-item[1], item[0]))]
+    lines.append(f"\n<b>Топ авторов</b> (всего авторов: {len(stats.users)}):")
+    for place, (user_id, username, count) in enumerate(stats.top_reporters(), 1):
+        author = f"@{username}" if username else f'<a href="tg://user?id={user_id}">{user_id}</a>'
+        lines.append(f"{place}. {author} — {count}")
+    daily = stats.daily.series(now)
+    hourly = stats.hourly.series(now, 24)
+    profile = stats.hour_of_day(now)
+    lines += [
+        f"\n<b>По дням за {stats.days} дн</b> (макс. {max(daily)}):",
+        f"<code>{sparkline(daily)}</code>",
+        f"<b>По часам за 24 ч</b> (макс. {max(hourly)}):",
+        f"<code>{sparkline(hourly)}</code>",
+    ]
+    if max(profile):
+        lines.append(f"Самый загруженный час (UTC): {profile.index(max(profile)):02d}:00")
+    return "\n".join(lines)
+
+
 @dp.message(Command("stats"))
 async def cmd_stats(message: types.Message):
     if not message.from_user or (message.from_user.username or "").lower() != "wildskjegg":
         await message.answer("У вас нет прав доступа к этой команде.")
         return
-    await message.answer("Аналитика задач будет доступна в ближайшем обновлении. (Функционал в разработке)")
+    await message.answer(render_stats(task_stats, int(time.time())))
+
+# Синхронизация архива с очередью Yandex Tracker: создание задач и подтягивание их статусов
+tracker_sync = TrackerSync(
+    database,
+    TrackerClient(
+        config.TRACKER_URL, config.TRACKER_TOKEN,
+        org_id=config.TRACKER_ORG_ID,
+        cloud_org=config.TRACKER_CLOUD_ORG,
+        max_concurrency=config.TRACKER_CONCURRENCY,
+        rate=config.TRACKER_RATE
+    ),
+    config.TRACKER_QUEUE,
+    since_days=config.TRACKER_SYNC_DAYS,
+    batch_size=config.TRACKER_BATCH_SIZE,
+    page_size=config.TRACKER_PAGE_SIZE,
+    interval=config.TRACKER_SYNC_INTERVAL,
+    cache_ttl=config.TRACKER_CACHE_TTL
+) if config.TRACKER_TOKEN and config.TRACKER_QUEUE else None
+
+
+async def render_external(sync: TrackerSync) -> str:
+    summary = await sync.summary()
+    client = sync.client
+    lines = [f"🔗 <b>Yandex Tracker</b>, очередь <code>{html.escape(sync.queue)}</code>\n"]
+    lines += [f"{html.escape(status or 'без статуса')}: {count}" for status, count in summary["statuses"]]
+    if not summary["statuses"]:
+        lines.append("Задачи ещё не создавались")
+    lines.append(f"\nОжидают создания: {summary['waiting']} · отклонены Tracker: {summary['failed']}")
+    report = sync.last_report
+    if report is not None:
+        last = time.strftime('%d.%m.%Y %H:%M:%S', time.localtime(sync.last_sync))
+        lines.append(
+            f"Последняя синхронизация: {last}, создано {report.pushed}, изменений {report.changed}, "
+            f"запросов {report.requests} за {report.seconds:.1f} с")
+    calls = ", ".join(f"{kind} {count}" for kind, count in sorted(client.calls.items())) or "нет"
+    lines.append(f"Запросов к API с запуска: {calls}; повторов {client.retries}")
+    cache = sync.cache
+    lines.append(f"Кэш статусов: попаданий {cache.hits}, 304 {cache.revalidated}, загрузок {cache.misses}")
+    lines.append("\n<code>/external sync</code> — синхронизировать сейчас, <code>/external КЛЮЧ-1</code> — статус задачи")
+    return "\n".join(lines)
+
 
 @dp.message(Command("external"))
 async def cmd_external(message: types.Message):
     if not message.from_user or (message.from_user.username or "").lower() != "wildskjegg":
         await message.answer("У вас нет прав доступа к этой команде.")
         return
-    await message.answer("Интеграция с внешними сервисами (например Jira, Trello) в разработке.")
+    if tracker_sync is None:
+        await message.answer("Синхронизация с Yandex Tracker не настроена: задайте TRACKER_TOKEN и TRACKER_QUEUE.")
+        return
+    parts = message.text.split()
+    try:
+        if len(parts) > 1 and parts[1].lower() == "sync":
+            await tracker_sync.sync()
+        elif len(parts) > 1:
+            state = await tracker_sync.status(parts[1].upper())
+            await message.answer(
+                f"🔗 <b>{html.escape(state.key)}</b>: {html.escape(state.status_display)}\n"
+                f"Обновлена: {html.escape(state.updated_at)}")
+            return
+        await message.answer(await render_external(tracker_sync))
+    except TrackerError as e:
+        logger.warning("Ошибка запроса к Tracker: %s", e)
+        await message.answer(f"⚠️ Tracker ответил ошибкой: {html.escape(str(e)[:200])}")
 
 @dp.message(Command("settings"))
 async def cmd_settings(message: types.Message):
@@ -348,40 +676,57 @@ async def cmd_bloker(message: types.Message):
         await bot.send_chat_action(chat_id=message.chat.id, action="typing")
         # Получаем задачи только для текущего пользователя
         user_id = message.from_user.id if message.from_user else None
-        tasks = await fetch_blocker_tasks(user_id)
-        
-        if not tasks:
-            await message.answer("✅ Активных блокирующих задач не найдено!")
-            return
-
-        builder = InlineKeyboardBuilder()
-        response = ["🚨 <b>Блокирующие задачи:</b>\n"]
-        for idx, task in enumerate(tasks, 1):
-            response.append(
-                f"{idx}. <b>Задача {idx}</b>\n"
-                f"📅 {task['date']}\n"
-                f"📝 {task['text'][:150]}..."
-            )
-            builder.button(text=f"Задача {idx}", url=task['link'])
-
-        builder.adjust(2)
-        await message.answer(
-            "\n".join(response),
-            reply_markup=builder.as_markup(),
-            parse_mode=ParseMode.HTML
-        )
+        text, markup = await get_task_list_reply(BLOCKER_TASKS, user_id)
+        await message.answer(text, reply_markup=markup, parse_mode=ParseMode.HTML)
 
     except Exception as e:
         logger.error(f"Ошибка в cmd_bloker: {e}")
         await message.answer("⚠️ Произошла ошибка при получении блокирующих задач!")
 
+# Смещение в inline-режиме — ключ последней показанной задачи, так следующая страница
+# не пересчитывает предыдущие и не съезжает при появлении новых задач
+def encode_offset(task: TaskRecord) -> str:
+    return "{}:{}:{}".format(*task.key)
+
+
+def decode_offset(offset: str) -> Optional[Tuple[int, int, int]]:
+    try:
+        timestamp, chat_id, message_id = map(int, offset.split(":"))
+    except ValueError:
+        return None
+    return timestamp, chat_id, message_id
+
+
+def task_article(task: TaskRecord) -> types.InlineQueryResultArticle:
+    return types.InlineQueryResultArticle(
+        id=f"{task.chat_id}_{task.message_id}",
+        title=f"{' '.join(sorted(task.tags))} · {task.date}",
+        description=task.text[:150],
+        url=task.link,
+        input_message_content=types.InputTextMessageContent(
+            message_text=f"📝 {html.escape(task.text)}\n🔗 <a href=\"{task.link}\">Открыть задачу</a>",
+            parse_mode=ParseMode.HTML,
+            disable_web_page_preview=True
+        )
+    )
+
+
 async def inline_query_handler(inline_query: types.InlineQuery):
-    article = types.InlineQueryResultArticle(
-        id='1',
-        title='Пример ответа',
-        input_message_content=types.InputTextMessageContent('Пример ответа')
+    # Ищем только среди задач самого пользователя, поэтому ответ персональный
+    query = SearchQuery(inline_query.query)
+    tasks = CriticalTasksArchive.search(
+        query,
+        user_id=inline_query.from_user.id,
+        limit=config.INLINE_PAGE_SIZE,
+        before=decode_offset(inline_query.offset) if inline_query.offset else None
+    )
+    next_offset = encode_offset(tasks[-1]) if len(tasks) == config.INLINE_PAGE_SIZE else ""
+    await inline_query.answer(
+        [task_article(task) for task in tasks],
+        cache_time=config.INLINE_CACHE_TIME,
+        is_personal=True,
+        next_offset=next_offset
     )
-    await inline_query.answer([article], cache_time=1)
 
 # Регистрирую inline query обработчик вручную
 dp.inline_query.register(inline_query_handler)
@@ -407,16 +752,105 @@ async def errors_handler(update: types.Update, exception: Exception):
     return True
 
 
+# Метрики: задержка и ошибки по типу апдейта и обработчику, размеры очередей и архива
+metrics_registry = MetricsRegistry()
+slow_update_profiler = (
+    SlowUpdateProfiler(config.SLOW_UPDATE_THRESHOLD, interval=config.PROFILER_INTERVAL)
+    if config.SLOW_UPDATE_THRESHOLD > 0 else None
+)
+MetricsMiddleware(metrics_registry, profiler=slow_update_profiler).setup(dp)
+metrics_registry.gauge("bot_archive_tasks", "Задачи в памяти (горячее окно)", lambda: len(CriticalTasksArchive))
+metrics_registry.gauge("bot_archive_bytes", "Оценка памяти под задачи", lambda: CriticalTasksArchive.bytes_used)
+metrics_registry.gauge("bot_archive_stored_tasks", "Задачи в архиве SQLite", lambda: task_stats.total)
+metrics_registry.gauge("bot_archive_write_buffer", "Задачи, ожидающие записи в SQLite", lambda: task_archive.pending)
+metrics_registry.gauge("bot_reminders_pending", "Запланированные напоминания", lambda: len(reminder_scheduler))
+metrics_registry.gauge("bot_outbound_queue", "Исходящие запросы в очереди ограничителя", lambda: outbound_limiter.pending)
+metrics_registry.gauge("bot_outbound_retries_total", "Повторы после RetryAfter",
+                       lambda: outbound_limiter.retries, kind="counter")
+metrics_registry.gauge("bot_render_cache_hits_total", "Попадания в кэш ответов", lambda: render_cache.hits, kind="counter")
+metrics_registry.gauge("bot_render_cache_misses_total", "Промахи кэша ответов", lambda: render_cache.misses, kind="counter")
+if tracker_sync is not None:
+    metrics_registry.gauge("bot_tracker_requests_total", "Запросы к API Yandex Tracker",
+                           lambda: tracker_sync.client.requests, kind="counter")
+metrics_server = MetricsServer(metrics_registry, host=config.METRICS_HOST, port=config.METRICS_PORT)
+
+
+# Открываем архив, прогреваем память свежими задачами и поднимаем напоминания
+@dp.startup()
+async def on_startup():
+    await task_archive.open()
+    since = int(time.time()) - config.ARCHIVE_WARM_DAYS * 86400
+    tasks = await task_archive.load_recent(since, config.ARCHIVE_WARM_LIMIT)
+    for task in reversed(tasks):
+        CriticalTasksArchive.add(task)
+    # Старше загруженного окна задачи есть только в архиве
+    CriticalTasksArchive.mark_evicted(tasks[-1].timestamp if len(tasks) == config.ARCHIVE_WARM_LIMIT else since - 1)
+    logger.info(f"Загружено задач из архива: {len(tasks)}")
+    task_stats.load(await task_archive.totals(since=int(time.time()) - config.STATS_DAYS * 86400))
+    logger.info(f"Статистика восстановлена: {task_stats.total} задач в архиве")
+    await reminder_scheduler.open()
+    if tracker_sync is not None:
+        await tracker_sync.open()
+    if config.METRICS_PORT:
+        await metrics_server.start()
+    if slow_update_profiler is not None:
+        slow_update_profiler.start()
+
+
+# Дописываем буферы на диск перед остановкой
+@dp.shutdown()
+async def on_shutdown():
+    if slow_update_profiler is not None:
+        slow_update_profiler.stop()
+    await metrics_server.stop()
+    if tracker_sync is not None:
+        await tracker_sync.close()
+    await reminder_scheduler.close()
+    await task_archive.close()
+
+
+# Приём апдейтов через вебхук вместо long polling
+async def run_webhook():
+    server = WebhookServer(
+        dp, bot,
+        path=config.WEBHOOK_PATH,
+        secret_token=config.WEBHOOK_SECRET,
+        max_concurrency=config.WEBHOOK_MAX_CONCURRENCY,
+        max_pending=config.WEBHOOK_MAX_PENDING,
+        drain_timeout=config.WEBHOOK_DRAIN_TIMEOUT
+    )
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            # Windows: остановка по Ctrl+C через KeyboardInterrupt
+            pass
+
+    await dp.emit_startup(bot=bot)
+    try:
+        # Без WEBHOOK_URL сервер не регистрируется в Telegram: удобно для локальной проверки
+        await server.serve(config.WEBHOOK_HOST, config.WEBHOOK_PORT, stop, webhook_url=config.WEBHOOK_URL or None)
+    finally:
+        await dp.emit_shutdown(bot=bot)
+        await bot.session.close()
+
+
 # Основная функция запуска бота
 async def main():
     try:
-        await bot.set_my_commands([types.BotCommand(command=cmd, description=desc) for cmd, desc in COMMANDS])
-        logger.info("Бот запущен")
-        await dp.start_polling(bot)
+        # Без WEBHOOK_URL вебхук проверяется локально, без обращений к Telegram
+        if config.BOT_MODE != "webhook" or config.WEBHOOK_URL:
+            await bot.set_my_commands([types.BotCommand(command=cmd, description=desc) for cmd, desc in COMMANDS])
+        logger.info(f"Бот запущен, режим: {config.BOT_MODE}")
+        if config.BOT_MODE == "webhook":
+            await run_webhook()
+        else:
+            await dp.start_polling(bot)
     except Exception as e:
         logger.critical(f"Критическая ошибка при запуске: {e}")
 
 
 if __name__ == '__main__':
-    import asyncio
     asyncio.run(main()) 
\ No newline at end of file
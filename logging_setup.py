@@ -0,0 +1,94 @@
+import atexit
+import copy
+import datetime
+import gzip
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import shutil
+from typing import Optional
+
+
+TEXT_FORMAT = "%(asctime)s [%(levelname)s] %(message)s"
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись — одна строка JSON, для сбора логов в Loki/ELK."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.datetime.fromtimestamp(record.created, tz=datetime.timezone.utc).isoformat(
+                timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class _LocalQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler для очереди внутри процесса.
+
+    Стандартный prepare форматирует запись целиком, вместе с трейсбеком, прямо в потоке
+    цикла событий и очищает exc_info: это нужно, только если запись сериализуется.
+    Здесь подставляются лишь аргументы сообщения, а трейсбек форматирует фоновый поток.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def _gzip_rotator(source: str, dest: str) -> None:
+    with open(source, "rb") as src, gzip.open(dest, "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    os.remove(source)
+
+
+def _file_handler(path: str, max_bytes: int, when: str, backup_count: int) -> logging.Handler:
+    if when:
+        handler = logging.handlers.TimedRotatingFileHandler(
+            path, when=when, backupCount=backup_count, encoding="utf-8", utc=True)
+    else:
+        handler = logging.handlers.RotatingFileHandler(
+            path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8")
+    # Старые файлы сжимаются при ротации: bot.log.1.gz, bot.log.2.gz, ...
+    handler.namer = lambda name: name + ".gz"
+    handler.rotator = _gzip_rotator
+    return handler
+
+
+def setup_logging(path: Optional[str] = "bot.log", level: str = "INFO", json_format: bool = False,
+                  max_bytes: int = 10 * 1024 * 1024, when: str = "",
+                  backup_count: int = 10) -> logging.handlers.QueueListener:
+    """Настраивает корневой логгер: записи кладутся в очередь, а в файл и консоль их пишет фоновый поток.
+
+    Поток цикла событий только подставляет аргументы в сообщение; трейсбеки, форматирование
+    и системные вызовы записи выполняются в фоновом потоке. Файл ротируется по размеру
+    (max_bytes) или по времени (when, например "midnight"), старые части сжимаются gzip.
+    """
+    formatter = JsonFormatter() if json_format else logging.Formatter(TEXT_FORMAT)
+    handlers = [logging.StreamHandler()]
+    if path:
+        handlers.append(_file_handler(path, max_bytes, when, backup_count))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(_LocalQueueHandler(log_queue))
+    root.setLevel(level)
+
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    # Дописываем очередь при завершении процесса
+    atexit.register(listener.stop)
+    return listener
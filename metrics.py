@@ -0,0 +1,270 @@
+import logging
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter as _Counter, deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+from aiohttp import web
+from aiogram import BaseMiddleware, Dispatcher
+from aiogram.types import TelegramObject, Update
+
+
+logger = logging.getLogger(__name__)
+
+Labels = Tuple[str, ...]
+
+# Границы корзин задержки обработки апдейта, в секундах
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(names: Labels, values: Labels, extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Labels = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, *values: str, amount: float = 1) -> None:
+        self._values[values] = self._values.get(values, 0) + amount
+
+    def collect(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        for values, value in self._values.items():
+            yield f"{self.name}{_format_labels(self.labels, values)} {value}"
+
+
+class Histogram:
+    """Гистограмма с фиксированными корзинами: наблюдение — бинарный поиск и два сложения."""
+
+    def __init__(self, name: str, help: str, labels: Labels = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        # По набору меток: счётчики корзин (последняя — +Inf) и сумма значений
+        self._series: Dict[Labels, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, *values: str) -> None:
+        series = self._series.get(values)
+        if series is None:
+            series = self._series[values] = ([0] * (len(self.buckets) + 1), [0.0])
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1][0] += value
+
+    def collect(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        for values, (counts, total) in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound}"'
+                yield f"{self.name}_bucket{_format_labels(self.labels, values, le)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labels, values)} {total[0]}"
+            yield f"{self.name}_count{_format_labels(self.labels, values)} {cumulative}"
+
+
+class Gauge:
+    """Значение снимается функцией в момент запроса /metrics, поэтому ничего не стоит между запросами.
+
+    Через kind="counter" так же отдаются счётчики, которые уже ведут другие компоненты.
+    """
+
+    def __init__(self, name: str, help: str, func: Callable[[], float], kind: str = "gauge") -> None:
+        self.name = name
+        self.help = help
+        self.func = func
+        self.kind = kind
+
+    def collect(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {self.kind}"
+        try:
+            yield f"{self.name} {self.func()}"
+        except Exception as e:
+            logger.warning(f"Не удалось получить метрику {self.name}: {e}")
+
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        self._metrics: List[Any] = []
+
+    def counter(self, name: str, help: str, labels: Labels = ()) -> Counter:
+        metric = Counter(name, help, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help: str, labels: Labels = ()) -> Histogram:
+        metric = Histogram(name, help, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def gauge(self, name: str, help: str, func: Callable[[], float], kind: str = "gauge") -> Gauge:
+        metric = Gauge(name, help, func, kind)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Все метрики в текстовом формате Prometheus."""
+        return "\n".join(line for metric in self._metrics for line in metric.collect()) + "\n"
+
+
+class SlowUpdateProfiler:
+    """Сэмплирующий профилировщик для медленных апдейтов.
+
+    Фоновый поток раз в interval секунд снимает стек потока цикла событий, но только
+    пока какой-то апдейт обрабатывается дольше threshold, поэтому в обычной работе
+    почти ничего не стоит. Когда медленный апдейт завершается, в лог пишутся
+    самые частые стеки за время его обработки.
+    """
+
+    def __init__(self, threshold: float, interval: float = 0.01, depth: int = 12, top: int = 5) -> None:
+        self.threshold = threshold
+        self.interval = interval
+        self.depth = depth
+        self.top = top
+        self._active: Dict[int, float] = {}
+        self._samples: Deque[Tuple[float, Tuple[str, ...]]] = deque(maxlen=10000)
+        self._loop_thread: Optional[int] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._loop_thread = threading.get_ident()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="slow-update-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            now = time.perf_counter()
+            # Копия: словарь меняется в потоке цикла событий
+            if not any(now - started > self.threshold for started in list(self._active.values())):
+                continue
+            frame = sys._current_frames().get(self._loop_thread)
+            stack = []
+            while frame is not None and len(stack) < self.depth:
+                code = frame.f_code
+                stack.append(f"{code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno} {code.co_name}")
+                frame = frame.f_back
+            self._samples.append((now, tuple(stack)))
+
+    def begin(self, key: int) -> None:
+        self._active[key] = time.perf_counter()
+
+    def end(self, key: int, label: str) -> None:
+        started = self._active.pop(key, None)
+        if started is None:
+            return
+        now = time.perf_counter()
+        if now - started < self.threshold:
+            return
+        stacks = _Counter(stack for at, stack in list(self._samples) if at >= started)
+        report = [f"Медленный апдейт {label}: {now - started:.3f} с, сэмплов {sum(stacks.values())}"]
+        for stack, count in stacks.most_common(self.top):
+            report.append(f"  {count} × " + " <- ".join(stack))
+        logger.warning("\n".join(report))
+
+
+class _UpdateScope:
+    # Общий для внешнего и внутреннего middleware объект: внутренний записывает имя обработчика
+    __slots__ = ("handler",)
+
+    def __init__(self) -> None:
+        self.handler = "unhandled"
+
+
+class MetricsMiddleware(BaseMiddleware):
+    """Внешний middleware диспетчера: задержка и ошибки по типу апдейта и обработчику.
+
+    Время считается от входа апдейта в диспетчер до выхода из обработчика, то есть
+    вместе с фильтрами (например, классификатором хэштегов). Имя сработавшего
+    обработчика сообщает внутренний middleware, установленный через setup.
+    """
+
+    def __init__(self, registry: MetricsRegistry, profiler: Optional[SlowUpdateProfiler] = None) -> None:
+        self.profiler = profiler
+        self.latency = registry.histogram(
+            "bot_update_duration_seconds", "Время обработки апдейта", ("update_type", "handler"))
+        self.errors = registry.counter(
+            "bot_update_errors_total", "Необработанные исключения в обработчиках", ("update_type", "handler"))
+
+    def setup(self, dp: Dispatcher) -> None:
+        dp.update.outer_middleware(self)
+        for name, observer in dp.observers.items():
+            if name not in ("update", "error"):
+                observer.middleware(self._name_handler)
+
+    @staticmethod
+    async def _name_handler(handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                            event: TelegramObject, data: Dict[str, Any]) -> Any:
+        scope = data.get("metrics_scope")
+        if scope is not None:
+            scope.handler = data["handler"].callback.__name__
+        return await handler(event, data)
+
+    async def __call__(self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: Update, data: Dict[str, Any]) -> Any:
+        scope = data["metrics_scope"] = _UpdateScope()
+        update_type = event.event_type
+        if self.profiler is not None:
+            self.profiler.begin(event.update_id)
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            self.errors.inc(update_type, scope.handler)
+            raise
+        finally:
+            self.latency.observe(time.perf_counter() - started, update_type, scope.handler)
+            if self.profiler is not None:
+                self.profiler.end(event.update_id, f"{event.update_id} ({update_type}, {scope.handler})")
+
+
+class MetricsServer:
+    """Локальный HTTP-сервер с /metrics для Prometheus."""
+
+    def __init__(self, registry: MetricsRegistry, host: str = "127.0.0.1", port: int = 9102) -> None:
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self._runner: Optional[web.AppRunner] = None
+
+    async def handle(self, request: web.Request) -> web.Response:
+        return web.Response(text=self.registry.render(),
+                            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+    async def start(self) -> None:
+        app = web.Application()
+        app.router.add_get("/metrics", self.handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        try:
+            await web.TCPSite(self._runner, self.host, self.port).start()
+        except OSError as e:
+            # Занятый порт метрик не должен мешать работе бота
+            logger.warning(f"Не удалось открыть /metrics на {self.host}:{self.port}: {e}")
+            await self.stop()
+            return
+        logger.info(f"Метрики доступны на http://{self.host}:{self.port}/metrics")
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
@@ -0,0 +1,221 @@
+import asyncio
+import contextvars
+import logging
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Any, Deque, Dict, Iterator, Optional, Set, Tuple
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import SendChatAction, TelegramMethod
+from aiogram.methods.base import TelegramType
+
+if TYPE_CHECKING:
+    from aiogram import Bot
+
+
+logger = logging.getLogger(__name__)
+
+# Приоритеты отправки: меньше — раньше
+PRIORITY_REPLY = 0
+PRIORITY_BACKGROUND = 1
+
+_priority: contextvars.ContextVar[int] = contextvars.ContextVar("outbound_priority", default=PRIORITY_REPLY)
+
+
+@contextmanager
+def outbound_priority(priority: int) -> Iterator[None]:
+    """Задаёт приоритет всех запросов к API внутри блока (например, для рассылки напоминаний)."""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate  # токенов в секунду
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0  # после RetryAfter
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        self._refill(now)
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def consume(self) -> None:
+        self.tokens -= 1
+
+
+class _Waiter:
+    __slots__ = ("chat_id", "future", "chat_limited")
+
+    def __init__(self, chat_id: Optional[int], future: asyncio.Future, chat_limited: bool) -> None:
+        self.chat_id = chat_id
+        self.future = future
+        self.chat_limited = chat_limited
+
+
+class OutboundLimiter(BaseRequestMiddleware):
+    """Middleware сессии бота, ограничивающее частоту исходящих запросов.
+
+    Запросы с chat_id проходят через общий лимит (~30 сообщений в секунду) и лимит
+    чата (~20 сообщений в минуту для групп). Ожидающие запросы разложены по очередям
+    приоритетов: ответы на команды уходят раньше напоминаний. На RetryAfter чат
+    блокируется на указанное время и запрос повторяется. Повторный send_chat_action
+    в тот же чат, пока предыдущий ещё отображается, не отправляется.
+    """
+
+    def __init__(self, global_rate: float = 30.0, group_per_minute: float = 20.0, private_rate: float = 1.0,
+                 global_burst: float = 5.0, chat_burst: float = 3.0,
+                 max_retries: int = 3, chat_action_ttl: float = 5.0) -> None:
+        # Telegram считает лимиты по скользящему окну, поэтому запас токенов плюс
+        # пополнение за окно не должны превышать лимит
+        self.global_bucket = TokenBucket(max(global_rate - global_burst, 1), global_burst)
+        self.group_per_minute = group_per_minute
+        self.private_rate = private_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.chat_action_ttl = chat_action_ttl
+        self._chats: Dict[int, TokenBucket] = {}
+        self._lanes: Tuple[Deque[_Waiter], ...] = (deque(), deque())
+        # Последнее действие в чате: (action, время отправки)
+        self._chat_actions: Dict[int, Tuple[str, float]] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._pump: Optional[asyncio.Task] = None
+        self.retries = 0
+        self.dropped_chat_actions = 0
+
+    @property
+    def pending(self) -> int:
+        return sum(len(lane) for lane in self._lanes)
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if chat_id < 0:
+                rate = max(self.group_per_minute - self.chat_burst, 1) / 60
+            else:
+                rate = self.private_rate
+            bucket = TokenBucket(rate, self.chat_burst)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: "Bot",
+        method: TelegramMethod[TelegramType],
+    ) -> Any:
+        chat_id = getattr(method, "chat_id", None)
+        # Запросы вне чатов (getUpdates, answerCallbackQuery, ...) не ограничиваем
+        if not isinstance(chat_id, int):
+            return await make_request(bot, method)
+
+        is_chat_action = isinstance(method, SendChatAction)
+        if is_chat_action and self._skip_chat_action(chat_id, str(method.action)):
+            self.dropped_chat_actions += 1
+            return True
+
+        for attempt in range(self.max_retries + 1):
+            # Действие «печатает» не расходует лимит чата: за ним всё равно последует сообщение
+            await self._acquire(chat_id, chat_limited=not is_chat_action)
+            try:
+                result = await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                if attempt == self.max_retries:
+                    raise
+                self.retries += 1
+                logger.warning("Flood control в чате %s, повтор через %s с", chat_id, e.retry_after)
+                self._chat_bucket(chat_id).blocked_until = time.monotonic() + e.retry_after
+                continue
+            if not is_chat_action:
+                # Отправленное сообщение снимает индикатор набора, следующий уже не лишний
+                self._chat_actions.pop(chat_id, None)
+            return result
+
+    def _skip_chat_action(self, chat_id: int, action: str) -> bool:
+        now = time.monotonic()
+        previous = self._chat_actions.get(chat_id)
+        if previous is not None and previous[0] == action and now - previous[1] < self.chat_action_ttl:
+            return True
+        # Если в чат уже стоят сообщения в очереди, индикатор набора ничего не добавит
+        if any(waiter.chat_id == chat_id for lane in self._lanes for waiter in lane):
+            return True
+        self._chat_actions[chat_id] = (action, now)
+        if len(self._chat_actions) > 10000:
+            self._chat_actions = {
+                chat: item for chat, item in self._chat_actions.items() if now - item[1] < self.chat_action_ttl
+            }
+        return False
+
+    async def _acquire(self, chat_id: int, chat_limited: bool) -> None:
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        # Быстрый путь: очереди пусты и лимиты не исчерпаны
+        if not self.pending and self._try_grant(chat_id, chat_limited, time.monotonic()) == 0:
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._lanes[min(_priority.get(), len(self._lanes) - 1)].append(_Waiter(chat_id, future, chat_limited))
+        if self._pump is None or self._pump.done():
+            self._pump = asyncio.create_task(self._run_pump())
+        self._wakeup.set()
+        await future
+
+    def _try_grant(self, chat_id: int, chat_limited: bool, now: float) -> float:
+        # Возвращает 0, если токены списаны, иначе сколько ждать до следующей попытки
+        wait = self.global_bucket.wait_time(now)
+        if chat_limited or self._chat_bucket(chat_id).blocked_until > now:
+            wait = max(wait, self._chat_bucket(chat_id).wait_time(now))
+        if wait > 0:
+            return wait
+        self.global_bucket.consume()
+        if chat_limited:
+            self._chat_bucket(chat_id).consume()
+        return 0.0
+
+    async def _run_pump(self) -> None:
+        while self.pending:
+            self._wakeup.clear()
+            now = time.monotonic()
+            wait = self._grant_next(now)
+            if wait == 0:
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+            except asyncio.TimeoutError:
+                pass
+
+    def _grant_next(self, now: float) -> float:
+        # Обходим очереди по приоритету; внутри очереди пропускаем чаты, исчерпавшие свой лимит
+        soonest = None
+        for lane in self._lanes:
+            blocked: Set[int] = set()
+            for index, waiter in enumerate(lane):
+                if waiter.future.cancelled():
+                    del lane[index]
+                    return 0.0
+                if waiter.chat_id in blocked:
+                    continue
+                wait = self._try_grant(waiter.chat_id, waiter.chat_limited, now)
+                if wait == 0:
+                    del lane[index]
+                    waiter.future.set_result(None)
+                    return 0.0
+                if self.global_bucket.wait_time(now) > 0:
+                    # Общий лимит исчерпан — дальше смотреть бессмысленно
+                    return wait
+                blocked.add(waiter.chat_id)
+                soonest = wait if soonest is None else min(soonest, wait)
+        return soonest if soonest is not None else 0.0
@@ -0,0 +1,201 @@
+import asyncio
+import heapq
+import logging
+import math
+import time
+from collections import defaultdict
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from task_archive import Database
+
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS reminders (
+    id INTEGER PRIMARY KEY,
+    fire_at REAL NOT NULL,
+    chat_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    username TEXT
+);
+"""
+
+
+class Reminder:
+    __slots__ = ("id", "fire_at", "chat_id", "user_id", "username")
+
+    def __init__(self, id: int, fire_at: float, chat_id: int, user_id: int, username: Optional[str]) -> None:
+        self.id = id
+        self.fire_at = fire_at
+        self.chat_id = chat_id
+        self.user_id = user_id
+        self.username = username
+
+    def __repr__(self) -> str:
+        return f"Reminder(id={self.id}, chat_id={self.chat_id}, user_id={self.user_id}, fire_at={self.fire_at})"
+
+
+# Отправка пачки напоминаний, сработавших в одном чате в один тик
+SendReminders = Callable[[int, List[Reminder]], Awaitable[None]]
+
+
+class ReminderScheduler:
+    """Единый планировщик напоминаний на min-куче.
+
+    Вместо отдельной спящей корутины на каждое напоминание одна фоновая задача
+    ждёт ближайшего срабатывания. Время срабатывания округляется вверх до тика,
+    поэтому напоминания одного тика и одного чата уходят одним сообщением.
+    Напоминания хранятся в SQLite и восстанавливаются после перезапуска.
+    """
+
+    def __init__(self, database: Database, send: SendReminders, tick: float = 1.0) -> None:
+        self.database = database
+        self.send = send
+        self.tick = tick
+        self._heap: List[Tuple[float, int]] = []
+        self._pending: Dict[int, Reminder] = {}
+        self._by_user: Dict[int, Dict[int, Reminder]] = defaultdict(dict)
+        self._next_id = 1
+        # Изменения записываются ближайшим проходом цикла: накопившиеся к нему — одной транзакцией
+        self._inserts: List[Reminder] = []
+        self._deletes: List[int] = []
+        # Создаётся в open(): до Python 3.10 Event привязан к циклу, в котором создан,
+        # а планировщик создаётся при импорте bot.py, ещё до asyncio.run
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop_task: Optional[asyncio.Task] = None
+        self._sending: Set[asyncio.Task] = set()
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def _load(self) -> List[Reminder]:
+        rows = self.database.conn.execute("SELECT id, fire_at, chat_id, user_id, username FROM reminders").fetchall()
+        return [Reminder(*row) for row in rows]
+
+    async def open(self) -> None:
+        await self.database.open(SCHEMA)
+        for reminder in await self.database.run(self._load):
+            self._push(reminder)
+            self._next_id = max(self._next_id, reminder.id + 1)
+        self._wakeup = asyncio.Event()
+        self._loop_task = asyncio.create_task(self._loop())
+        logger.info(f"Загружено напоминаний: {len(self._pending)}")
+
+    async def close(self) -> None:
+        if self._loop_task is not None:
+            self._loop_task.cancel()
+            try:
+                await self._loop_task
+            except asyncio.CancelledError:
+                pass
+            self._loop_task = None
+        if self._sending:
+            await asyncio.gather(*self._sending, return_exceptions=True)
+        await self._flush()
+        await self.database.close()
+
+    def _push(self, reminder: Reminder) -> None:
+        self._pending[reminder.id] = reminder
+        self._by_user[reminder.user_id][reminder.id] = reminder
+        heapq.heappush(self._heap, (reminder.fire_at, reminder.id))
+
+    def _pop(self, reminder_id: int) -> Optional[Reminder]:
+        reminder = self._pending.pop(reminder_id, None)
+        if reminder is None:
+            return None
+        user_reminders = self._by_user[reminder.user_id]
+        del user_reminders[reminder_id]
+        if not user_reminders:
+            del self._by_user[reminder.user_id]
+        return reminder
+
+    def schedule(self, chat_id: int, user_id: int, username: Optional[str], delay: float) -> Reminder:
+        fire_at = math.ceil((time.time() + delay) / self.tick) * self.tick
+        reminder = Reminder(self._next_id, fire_at, chat_id, user_id, username)
+        self._next_id += 1
+        self._push(reminder)
+        self._inserts.append(reminder)
+        # Будим цикл: он запишет напоминание в базу и пересчитает время ожидания
+        self._notify()
+        return reminder
+
+    def for_user(self, user_id: int) -> List[Reminder]:
+        return sorted(self._by_user.get(user_id, {}).values(), key=lambda r: r.fire_at)
+
+    def cancel(self, user_id: int, reminder_id: int) -> bool:
+        # Запись в куче остаётся и будет пропущена при срабатывании
+        reminder = self._by_user.get(user_id, {}).get(reminder_id)
+        if reminder is None:
+            return False
+        self._pop(reminder_id)
+        self._deletes.append(reminder_id)
+        self._notify()
+        return True
+
+    def _notify(self) -> None:
+        # До open() будить некого: накопленное запишет первый проход цикла
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _flush(self) -> None:
+        if not (self._inserts or self._deletes) or self.database.conn is None:
+            return
+        inserts, self._inserts = self._inserts, []
+        deletes, self._deletes = self._deletes, []
+        try:
+            await self.database.run(self._write, inserts, deletes)
+        except Exception:
+            # Повторим запись при следующем проходе цикла
+            self._inserts[:0] = inserts
+            self._deletes[:0] = deletes
+            raise
+
+    def _write(self, inserts: List[Reminder], deletes: List[int]) -> None:
+        with self.database.conn:
+            self.database.conn.executemany(
+                "INSERT OR REPLACE INTO reminders (id, fire_at, chat_id, user_id, username) VALUES (?, ?, ?, ?, ?)",
+                [(r.id, r.fire_at, r.chat_id, r.user_id, r.username) for r in inserts],
+            )
+            self.database.conn.executemany("DELETE FROM reminders WHERE id = ?", [(i,) for i in deletes])
+
+    def _pop_due(self, now: float) -> List[Reminder]:
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            _, reminder_id = heapq.heappop(self._heap)
+            reminder = self._pop(reminder_id)
+            if reminder is not None:
+                due.append(reminder)
+                self._deletes.append(reminder_id)
+        return due
+
+    async def _fire(self, due: List[Reminder]) -> None:
+        by_chat: Dict[int, List[Reminder]] = defaultdict(list)
+        for reminder in due:
+            by_chat[reminder.chat_id].append(reminder)
+        results = await asyncio.gather(
+            *(self.send(chat_id, reminders) for chat_id, reminders in by_chat.items()),
+            return_exceptions=True,
+        )
+        for chat_id, result in zip(by_chat, results):
+            if isinstance(result, Exception):
+                logger.error("Ошибка отправки напоминаний в чат %s: %s", chat_id, result)
+
+    async def _loop(self) -> None:
+        while True:
+            self._wakeup.clear()
+            due = self._pop_due(time.time())
+            if due:
+                # Отправка не задерживает следующий тик
+                task = asyncio.create_task(self._fire(due))
+                self._sending.add(task)
+                task.add_done_callback(self._sending.discard)
+            try:
+                await self._flush()
+            except Exception as e:
+                logger.error(f"Ошибка сохранения напоминаний: {e}", exc_info=True)
+            timeout = max(0.0, self._heap[0][0] - time.time()) if self._heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,270 @@
+import asyncio
+import logging
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, NamedTuple, Optional, Tuple
+
+from task_store import TASK_TEXT_LIMIT, TaskKey, TaskRecord
+
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    chat_id INTEGER NOT NULL,
+    message_id INTEGER NOT NULL,
+    date INTEGER NOT NULL,
+    user_id INTEGER,
+    username TEXT,
+    text TEXT NOT NULL,
+    tags TEXT NOT NULL,
+    PRIMARY KEY (chat_id, message_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS tasks_date ON tasks (date);
+CREATE INDEX IF NOT EXISTS tasks_user_date ON tasks (user_id, date);
+CREATE TABLE IF NOT EXISTS task_tags (
+    tag TEXT NOT NULL,
+    user_id INTEGER,
+    date INTEGER NOT NULL,
+    chat_id INTEGER NOT NULL,
+    message_id INTEGER NOT NULL,
+    PRIMARY KEY (tag, chat_id, message_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS task_tags_tag_user_date ON task_tags (tag, user_id, date);
+"""
+
+TASK_COLUMNS = "chat_id, message_id, date, user_id, username, text, tags"
+
+
+def _task_row(task: TaskRecord, text: str) -> tuple:
+    return (task.chat_id, task.message_id, task.timestamp, task.user_id,
+            task.username, text, " ".join(sorted(task.tags)))
+
+
+def _task_from_row(row: tuple, text_limit: Optional[int] = TASK_TEXT_LIMIT) -> TaskRecord:
+    chat_id, message_id, date, user_id, username, text, tags = row
+    return TaskRecord(chat_id, message_id, date, text, tags.split(), user_id, username, text_limit)
+
+
+class ArchiveTotals(NamedTuple):
+    """Агрегаты по всему архиву для восстановления статистики после перезапуска."""
+    tags: List[Tuple[str, int]]
+    chats: List[Tuple[int, int]]
+    users: List[Tuple[Optional[int], int, Optional[str]]]  # (user_id, задач, username)
+    hours: List[Tuple[int, int]]  # (номер часа от эпохи, задач) начиная с since
+
+
+class Database:
+    """Соединение SQLite (WAL) и единственный поток для всех запросов к нему.
+
+    Архив задач, напоминания и синхронизация с Tracker работают с одним файлом через
+    общий Database: каждый открывает его со своей схемой, а соединение закрывается,
+    когда его закроет последний из открывших.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.conn: Optional[sqlite3.Connection] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._users = 0
+
+    async def run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    def _connect(self, schema: str) -> None:
+        if self.conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn = conn
+        self.conn.executescript(schema)
+
+    async def open(self, schema: str) -> None:
+        if self._executor is None:
+            # Один поток: соединение SQLite используется строго последовательно
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+        self._users += 1
+        await self.run(self._connect, schema)
+
+    async def close(self) -> None:
+        self._users -= 1
+        if self._users > 0 or self._executor is None:
+            return
+        if self.conn is not None:
+            await self.run(self.conn.close)
+            self.conn = None
+        self._executor.shutdown(wait=True)
+        self._executor = None
+
+
+class TaskArchive:
+    """Постоянный архив задач в SQLite (WAL).
+
+    Запись идёт пачками: обработчики только кладут задачу в буфер, а фоновая
+    задача сбрасывает буфер в базу через отдельный поток, не блокируя цикл событий.
+    """
+
+    def __init__(self, database: Database, batch_size: int = 500, flush_interval: float = 1.0,
+                 text_limit: Optional[int] = TASK_TEXT_LIMIT) -> None:
+        self.database = database
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.text_limit = text_limit  # Обрезка текста задач, загружаемых в память
+        # Задача и полный текст сообщения: в памяти текст обрезан, а в базу пишется целиком
+        self._buffer: List[Tuple[TaskRecord, str]] = []
+        # Создаётся в open(): до Python 3.10 Event привязан к циклу, в котором создан,
+        # а архив создаётся при импорте bot.py, ещё до asyncio.run
+        self._wakeup: Optional[asyncio.Event] = None
+        self._flusher: Optional[asyncio.Task] = None
+        self._closing = False
+
+    async def open(self) -> None:
+        await self.database.open(SCHEMA)
+        self._closing = False
+        self._wakeup = asyncio.Event()
+        self._flusher = asyncio.create_task(self._flush_loop())
+        logger.info(f"Архив задач открыт: {self.database.path}")
+
+    async def close(self) -> None:
+        if self._flusher is not None:
+            # До Python 3.10 wait_for теряет отмену, если событие сработало в ту же итерацию цикла:
+            # тогда фоновый сброс завершится сам, увидев флаг
+            self._closing = True
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+        # Пока шёл сброс, могли добавиться новые задачи: пишем всё до конца
+        while self._buffer:
+            await self.flush()
+        await self.database.close()
+
+    @property
+    def pending(self) -> int:
+        """Задачи в буфере, ещё не записанные в базу."""
+        return len(self._buffer)
+
+    def enqueue(self, task: TaskRecord, text: Optional[str] = None) -> None:
+        """Ставит задачу в очередь на запись; text — полный текст, если task.text обрезан."""
+        self._buffer.append((task, task.text if text is None else text))
+        if len(self._buffer) >= self.batch_size and self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _flush_loop(self) -> None:
+        while not self._closing:
+            # Любая ошибка только логируется: без этого цикла задачи попадут в базу лишь при остановке
+            try:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Ошибка записи архива задач: {e}", exc_info=True)
+                await asyncio.sleep(self.flush_interval)
+
+    async def flush(self) -> int:
+        if not self._buffer:
+            return 0
+        batch, self._buffer = self._buffer, []
+        try:
+            return await self.database.run(self._write_batch, batch)
+        except BaseException:
+            # Возвращаем пачку в буфер, чтобы повторить запись при следующем сбросе. Отмена тоже:
+            # close() отменяет фоновый сброс, пока запись ждёт своей очереди в потоке за чтением.
+            # Если запись всё же успела пройти, повтор безвреден — INSERT OR IGNORE
+            self._buffer[:0] = batch
+            raise
+
+    def _write_batch(self, batch: List[Tuple[TaskRecord, str]]) -> int:
+        rows = [_task_row(task, text) for task, text in batch]
+        tag_rows = [
+            (tag, task.user_id, task.timestamp, task.chat_id, task.message_id)
+            for task, _ in batch for tag in task.tags
+        ]
+        with self.database.conn:
+            before = self.database.conn.total_changes
+            self.database.conn.executemany(f"INSERT OR IGNORE INTO tasks ({TASK_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            inserted = self.database.conn.total_changes - before
+            self.database.conn.executemany(
+                "INSERT OR IGNORE INTO task_tags (tag, user_id, date, chat_id, message_id) VALUES (?, ?, ?, ?, ?)",
+                tag_rows,
+            )
+        return inserted
+
+    def _load_recent(self, since: int, limit: int) -> List[TaskRecord]:
+        cursor = self.database.conn.execute(
+            f"SELECT {TASK_COLUMNS} FROM tasks WHERE date >= ? ORDER BY date DESC LIMIT ?",
+            (since, limit),
+        )
+        return [_task_from_row(row, self.text_limit) for row in cursor]
+
+    async def load_recent(self, since: int, limit: int) -> List[TaskRecord]:
+        """Горячее окно для прогрева памяти при старте: задачи не старше since, от новых к старым."""
+        return await self.database.run(self._load_recent, since, limit)
+
+    def _page(self, tags: Optional[Tuple[str, ...]], user_id: Optional[int], limit: int,
+              before: Optional[TaskKey], after: Optional[TaskKey]) -> List[TaskRecord]:
+        # Тот же ключ (date, chat_id, message_id), что и в индексах TaskStore
+        conditions, params = [], []
+        if user_id is not None:
+            conditions.append("user_id = ?")
+            params.append(user_id)
+        if after is not None:
+            conditions.append("(date, chat_id, message_id) > (?, ?, ?)")
+            params.extend(after)
+        elif before is not None:
+            conditions.append("(date, chat_id, message_id) < (?, ?, ?)")
+            params.extend(before)
+        order = "ASC" if after is not None else "DESC"
+        order_by = f"ORDER BY date {order}, chat_id {order}, message_id {order} LIMIT ?"
+        if tags is None:
+            where = " AND ".join(conditions) or "1"
+            query = f"SELECT {TASK_COLUMNS} FROM tasks WHERE {where} {order_by}"
+            query_params = [*params, limit]
+        else:
+            # По каждому тегу — отрезок индекса (tag, user_id, date) длиной не больше limit;
+            # UNION сливает отрезки и убирает повторы задач с несколькими тегами
+            where = " AND ".join(["tag = ?", *conditions])
+            keys = " UNION ".join(
+                f"SELECT * FROM (SELECT date, chat_id, message_id FROM task_tags WHERE {where} {order_by})"
+                for _ in tags
+            )
+            columns = ", ".join("t." + column for column in TASK_COLUMNS.split(", "))
+            query = (f"SELECT {columns} FROM ({keys} {order_by}) AS k JOIN tasks AS t USING (chat_id, message_id) "
+                     f"ORDER BY k.date {order}, k.chat_id {order}, k.message_id {order}")
+            query_params = [value for tag in tags for value in (tag, *params, limit)] + [limit]
+        tasks = [_task_from_row(row, self.text_limit) for row in self.database.conn.execute(query, query_params)]
+        if after is not None:
+            tasks.reverse()
+        return tasks
+
+    async def page(self, tags: Optional[Tuple[str, ...]] = None, user_id: Optional[int] = None, limit: int = 10,
+                   before: Optional[TaskKey] = None, after: Optional[TaskKey] = None) -> List[TaskRecord]:
+        """Страница задач из базы от новых к старым, как TaskStore.latest: для задач, вытесненных из памяти."""
+        return await self.database.run(self._page, tags, user_id, limit, before, after)
+
+    def _totals(self, since: int) -> ArchiveTotals:
+        conn = self.database.conn
+        return ArchiveTotals(
+            tags=conn.execute("SELECT tag, COUNT(*) FROM task_tags GROUP BY tag").fetchall(),
+            chats=conn.execute("SELECT chat_id, COUNT(*) FROM tasks GROUP BY chat_id").fetchall(),
+            users=conn.execute("SELECT user_id, COUNT(*), MAX(username) FROM tasks GROUP BY user_id").fetchall(),
+            hours=conn.execute(
+                "SELECT date / 3600 AS hour, COUNT(*) FROM tasks WHERE date >= ? GROUP BY hour", (since,)
+            ).fetchall(),
+        )
+
+    async def totals(self, since: int) -> ArchiveTotals:
+        """Счётчики по тегам, чатам и пользователям за всё время и почасовые итоги с момента since."""
+        return await self.database.run(self._totals, since)
+
+    def _count(self) -> int:
+        return self.database.conn.execute("SELECT COUNT(*) FROM tasks").fetchone()[0]
+
+    async def count(self) -> int:
+        return await self.database.run(self._count)
@@ -0,0 +1,39 @@
+import re
+from typing import Any, Dict, FrozenSet, Iterable, Union
+
+from aiogram import types
+from aiogram.filters import Filter
+
+
+class TaskClassifier(Filter):
+    """Фильтр входящих сообщений отслеживаемых чатов.
+
+    Чат проверяется по frozenset, а все отслеживаемые хэштеги извлекаются за один
+    проход скомпилированного регулярного выражения. Найденные теги передаются
+    в обработчик аргументом ``tags``.
+    """
+
+    def __init__(self, chat_ids: Iterable[int], tags: Iterable[str]) -> None:
+        self.chat_ids: FrozenSet[int] = frozenset(chat_ids)
+        self.tags = tuple(tags)
+        # Теги сравниваются без учёта регистра, но сохраняются в том виде, как заданы в настройках
+        self._canonical = {tag.casefold(): tag for tag in self.tags}
+        # Длинные теги идут первыми, чтобы #Крит_Блокер не распознавался как #Крит
+        alternatives = "|".join(re.escape(tag) for tag in sorted(self.tags, key=len, reverse=True))
+        self._pattern = re.compile(rf"(?:{alternatives})(?!\w)", re.IGNORECASE) if self.tags else None
+
+    def extract(self, text: str) -> FrozenSet[str]:
+        if self._pattern is None:
+            return frozenset()
+        return frozenset(self._canonical[match.casefold()] for match in self._pattern.findall(text))
+
+    async def __call__(self, message: types.Message) -> Union[bool, Dict[str, Any]]:
+        if message.chat.id not in self.chat_ids or not message.text:
+            return False
+        tags = self.extract(message.text)
+        if not tags:
+            return False
+        return {"tags": tags}
+
+    def __str__(self) -> str:
+        return self._signature_to_string(chats=sorted(self.chat_ids), tags=self.tags)
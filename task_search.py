@@ -0,0 +1,125 @@
+import re
+import sys
+from collections import defaultdict
+from typing import Dict, FrozenSet, Iterator, List, Optional, Set, Tuple, Union
+
+from task_store import TaskKey, TaskRecord, _before, _index_insert, _index_remove
+
+
+_WORD_RE = re.compile(r"\w+")
+
+# Длина ключа префиксного индекса: запрос «плат» ищется по списку «пла» с проверкой по тексту
+PREFIX_LEN = 3
+
+
+def normalize(text: str) -> str:
+    return text.casefold().replace("ё", "е")
+
+
+def tokenize(text: str) -> FrozenSet[str]:
+    return frozenset(_WORD_RE.findall(normalize(text)))
+
+
+class SearchQuery:
+    """Разобранный запрос: слова ищутся целиком, последнее — по префиксу, пока его дописывают."""
+
+    __slots__ = ("words", "prefix")
+
+    def __init__(self, text: str) -> None:
+        words = _WORD_RE.findall(normalize(text))
+        # Если после последнего слова уже стоит пробел, слово считается законченным
+        self.prefix = words.pop() if words and not text[-1:].isspace() else None
+        self.words = tuple(dict.fromkeys(words))
+
+    def __bool__(self) -> bool:
+        return bool(self.words or self.prefix)
+
+    def matches(self, text: str) -> bool:
+        tokens = tokenize(text)
+        if not all(word in tokens for word in self.words):
+            return False
+        return self.prefix is None or any(token.startswith(self.prefix) for token in tokens)
+
+
+# Список ключей задач со словом. Большинство слов у пользователя встречается один раз,
+# поэтому единственный ключ хранится без списка
+Postings = Union[TaskKey, List[TaskKey]]
+
+
+def _as_list(postings: Postings) -> List[TaskKey]:
+    return [postings] if isinstance(postings, tuple) else postings
+
+
+class TextIndex:
+    """Инвертированный индекс по словам текста задач, разбитый по пользователям.
+
+    Для каждого пользователя хранятся два индекса с отсортированными ключами задач:
+    по целым словам и по первым PREFIX_LEN символам слов. Запрос обходит от новых
+    к старым самый короткий из подходящих списков, поэтому время поиска зависит
+    от размера страницы, а не от размера архива.
+    """
+
+    def __init__(self) -> None:
+        self._words: Dict[Optional[int], Dict[str, Postings]] = defaultdict(dict)
+        self._prefixes: Dict[Optional[int], Dict[str, Postings]] = defaultdict(dict)
+
+    @staticmethod
+    def _keys(task: TaskRecord) -> Tuple[FrozenSet[str], Set[str]]:
+        words = tokenize(task.text)
+        return words, {word[:PREFIX_LEN] for word in words}
+
+    def add(self, task: TaskRecord) -> None:
+        key = task.key
+        words, prefixes = self._keys(task)
+        for indexes, names in ((self._words[task.user_id], words), (self._prefixes[task.user_id], prefixes)):
+            for name in names:
+                postings = indexes.get(name)
+                if postings is None:
+                    # Одно и то же слово встречается в словарях многих пользователей — храним одну строку
+                    indexes[sys.intern(name)] = key
+                elif isinstance(postings, tuple):
+                    indexes[name] = [postings, key] if postings < key else [key, postings]
+                elif postings[-1] < key:
+                    postings.append(key)
+                else:
+                    _index_insert(postings, key)
+
+    def remove(self, task: TaskRecord) -> None:
+        if task.user_id not in self._words:
+            return
+        key = task.key
+        words, prefixes = self._keys(task)
+        for indexes, names in ((self._words, words), (self._prefixes, prefixes)):
+            user_indexes = indexes[task.user_id]
+            for name in names:
+                postings = user_indexes.get(name)
+                if postings is None:
+                    continue
+                if isinstance(postings, tuple):
+                    if postings == key:
+                        del user_indexes[name]
+                    continue
+                _index_remove(postings, key)
+                if len(postings) == 1:
+                    user_indexes[name] = postings[0]
+            if not user_indexes:
+                del indexes[task.user_id]
+
+    def candidates(self, user_id: Optional[int], query: SearchQuery,
+                   before: Optional[TaskKey] = None) -> Optional[Iterator[TaskKey]]:
+        """Ключи задач-кандидатов от новых к старым; окончательно их проверяет SearchQuery.matches.
+
+        None означает, что индекс не сужает выборку и задачи пользователя нужно просмотреть подряд:
+        так бывает с префиксом короче PREFIX_LEN, который и так встречается почти в каждой задаче.
+        """
+        if user_id not in self._words or not query:
+            return iter(())
+        found = [self._words[user_id].get(word) for word in query.words]
+        if query.prefix is not None and len(query.prefix) >= PREFIX_LEN:
+            found.append(self._prefixes[user_id].get(query.prefix[:PREFIX_LEN]))
+        if not found:
+            return None
+        if not all(found):
+            return iter(())
+        # Обходим самый короткий список, остальные условия проверяются по тексту задачи
+        return _before(min(map(_as_list, found), key=len), before)
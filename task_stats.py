@@ -0,0 +1,121 @@
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from task_archive import ArchiveTotals
+from task_store import TaskRecord
+
+
+class RollingCounter:
+    """Кольцо из size корзин по width секунд: счётчик задач за последние size * width секунд.
+
+    Корзина хранит номер своего интервала, поэтому устаревшие значения сбрасываются
+    при первой записи в новый интервал, а при чтении просто не учитываются.
+    """
+
+    __slots__ = ("width", "size", "_ids", "_counts")
+
+    def __init__(self, width: int, size: int) -> None:
+        self.width = width
+        self.size = size
+        self._ids = [-1] * size
+        self._counts = [0] * size
+
+    def add(self, timestamp: int, count: int = 1) -> None:
+        bucket = timestamp // self.width
+        pos = bucket % self.size
+        current = self._ids[pos]
+        if current == bucket:
+            self._counts[pos] += count
+        elif current < bucket:
+            self._ids[pos] = bucket
+            self._counts[pos] = count
+        # Иначе задача старше окна: корзину уже занял более новый интервал
+
+    def series(self, now: int, count: Optional[int] = None) -> List[int]:
+        """Значения последних count корзин, заканчивая текущей, от старых к новым."""
+        count = self.size if count is None else min(count, self.size)
+        end = now // self.width
+        result = []
+        for bucket in range(end - count + 1, end + 1):
+            pos = bucket % self.size
+            result.append(self._counts[pos] if self._ids[pos] == bucket else 0)
+        return result
+
+
+class TaskStats:
+    """Счётчики для /stats, обновляемые за O(1) при получении каждой задачи.
+
+    Итоги по тегам, чатам и пользователям ведутся за всё время, тренды — в кольцах
+    почасовых и суточных корзин за последние days дней. Топ авторов поддерживается
+    по ходу: счётчики только растут, поэтому достаточно сравнить автора с самым
+    слабым в топе. После перезапуска всё восстанавливается из архива через load.
+    """
+
+    def __init__(self, days: int = 30, top: int = 10) -> None:
+        self.days = days
+        self.top = top
+        self._reset()
+
+    def _reset(self) -> None:
+        self.total = 0
+        self.tags: Dict[str, int] = defaultdict(int)
+        self.chats: Dict[int, int] = defaultdict(int)
+        self.users: Dict[Optional[int], int] = defaultdict(int)
+        self.usernames: Dict[int, str] = {}
+        self.hourly = RollingCounter(3600, self.days * 24)
+        self.daily = RollingCounter(86400, self.days)
+        self._top: Dict[int, int] = {}
+
+    def add(self, task: TaskRecord) -> None:
+        self.total += 1
+        for tag in task.tags:
+            self.tags[tag] += 1
+        self.chats[task.chat_id] += 1
+        self._count_user(task.user_id, 1, task.username)
+        self.hourly.add(task.timestamp)
+        self.daily.add(task.timestamp)
+
+    def _count_user(self, user_id: Optional[int], count: int, username: Optional[str]) -> None:
+        self.users[user_id] += count
+        if user_id is None:
+            return
+        if username:
+            self.usernames[user_id] = username
+        count = self.users[user_id]
+        if user_id in self._top or len(self._top) < self.top:
+            self._top[user_id] = count
+            return
+        weakest = min(self._top, key=self._top.__getitem__)
+        if count > self._top[weakest]:
+            del self._top[weakest]
+            self._top[user_id] = count
+
+    def load(self, totals: ArchiveTotals) -> None:
+        """Пересчитывает счётчики по агрегатам архива (TaskArchive.totals)."""
+        self._reset()
+        for tag, count in totals.tags:
+            self.tags[tag] += count
+        for chat_id, count in totals.chats:
+            self.chats[chat_id] += count
+            self.total += count
+        for user_id, count, username in totals.users:
+            self._count_user(user_id, count, username)
+        for hour, count in totals.hours:
+            self.hourly.add(hour * 3600, count)
+            self.daily.add(hour * 3600, count)
+
+    def top_reporters(self) -> List[Tuple[int, Optional[str], int]]:
+        """Авторы с наибольшим числом задач: (user_id, username, задач)."""
+        ranked = sorted(self._top.items(), key=lambda item: (-item[1], item[0]))
+        return [(user_id, self.usernames.get(user_id), count) for user_id, count in ranked]
+
+    def last_hours(self, now: int, hours: int) -> int:
+        return sum(self.hourly.series(now, hours))
+
+    def hour_of_day(self, now: int) -> List[int]:
+        """Задачи по часу суток (UTC) за всё окно почасовых корзин."""
+        profile = [0] * 24
+        end = now // 3600
+        for offset, count in enumerate(self.hourly.series(now)):
+            profile[(end - self.hourly.size + 1 + offset) % 24] += count
+        return profile
@@ -0,0 +1,310 @@
+import datetime
+import heapq
+import sys
+import time
+from bisect import bisect_left, bisect_right, insort
+from collections import defaultdict
+from itertools import islice
+from typing import TYPE_CHECKING, Dict, FrozenSet, Iterable, Iterator, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from task_search import SearchQuery, TextIndex
+
+
+# Ключ задачи в индексах: (timestamp, chat_id, message_id).
+# Кортежи сравниваются лексикографически, поэтому каждый индекс упорядочен по времени.
+TaskKey = Tuple[int, int, int]
+
+# Сколько символов текста задачи держим в памяти; в ответах показывается не больше 150
+TASK_TEXT_LIMIT = 1000
+
+# Одинаковые наборы тегов повторяются у тысяч задач — храним по одному экземпляру
+_TAG_SETS: Dict[FrozenSet[str], FrozenSet[str]] = {}
+
+
+def _shared_tags(tags: Iterable[str]) -> FrozenSet[str]:
+    tags = frozenset(tags)
+    return _TAG_SETS.setdefault(tags, tags)
+
+
+class TaskRecord:
+    """Компактная запись задачи: только числа и строки, ссылка и дата строятся при отрисовке."""
+
+    __slots__ = ("timestamp", "chat_id", "message_id", "user_id", "username", "text", "tags")
+
+    def __init__(self, chat_id: int, message_id: int, timestamp: int, text: str, tags: Iterable[str],
+                 user_id: Optional[int] = None, username: Optional[str] = None,
+                 text_limit: Optional[int] = TASK_TEXT_LIMIT) -> None:
+        self.timestamp = int(timestamp)
+        self.chat_id = int(chat_id)
+        self.message_id = int(message_id)
+        self.user_id = user_id
+        self.username = sys.intern(username) if username else None
+        # None — без обрезки: такие записи не держатся в памяти, а идут в архив или в Tracker
+        self.text = text if text_limit is None else text[:text_limit]
+        self.tags = _shared_tags(tags)
+
+    @property
+    def key(self) -> TaskKey:
+        return self.timestamp, self.chat_id, self.message_id
+
+    @property
+    def link(self) -> str:
+        return f"https://t.me/c/{str(self.chat_id).replace('-100', '')}/{self.message_id}"
+
+    @property
+    def date(self) -> str:
+        date = datetime.datetime.fromtimestamp(self.timestamp, tz=datetime.timezone.utc)
+        return date.strftime("%d.%m.%Y %H:%M")
+
+    def size(self) -> int:
+        # Приблизительный объём записи в памяти без общих строк и наборов тегов
+        return sys.getsizeof(self) + sys.getsizeof(self.text)
+
+    def __repr__(self) -> str:
+        return f"TaskRecord(chat_id={self.chat_id}, message_id={self.message_id}, tags={sorted(self.tags)})"
+
+
+class RetentionPolicy:
+    """Ограничения архива в памяти. Ноль выключает ограничение."""
+
+    def __init__(self, max_age: int = 0, max_per_tag: int = 0, max_bytes: int = 0) -> None:
+        self.max_age = max_age  # в секундах
+        self.max_per_tag = max_per_tag
+        self.max_bytes = max_bytes
+
+
+def _index_insert(index: List[TaskKey], key: TaskKey) -> None:
+    # Сообщения почти всегда приходят по порядку, поэтому обычно это простой append
+    if not index or index[-1] < key:
+        index.append(key)
+    else:
+        insort(index, key)
+
+
+def _index_remove(index: List[TaskKey], key: TaskKey) -> None:
+    pos = bisect_left(index, key)
+    if pos < len(index) and index[pos] == key:
+        del index[pos]
+
+
+def _before(index: List[TaskKey], before: Optional[TaskKey]) -> Iterator[TaskKey]:
+    # Ключи индекса от новых к старым, строго раньше before (для постраничного вывода)
+    end = len(index) if before is None else bisect_left(index, before)
+    return map(index.__getitem__, range(end - 1, -1, -1))
+
+
+def _after(index: List[TaskKey], after: TaskKey) -> Iterator[TaskKey]:
+    # Ключи индекса от старых к новым, строго позже after (листание к более новым задачам)
+    return map(index.__getitem__, range(bisect_right(index, after), len(index)))
+
+
+class TaskStore:
+    """Хранилище задач в памяти со вторичными индексами по тегу, пользователю и чату."""
+
+    def __init__(self, retention: Optional[RetentionPolicy] = None,
+                 text_index: Optional["TextIndex"] = None) -> None:
+        self.retention = retention or RetentionPolicy()
+        # Полнотекстовый индекс для поиска (inline-режим); без него search недоступен
+        self.text_index = text_index
+        self._tasks: Dict[TaskKey, TaskRecord] = {}
+        self._all: List[TaskKey] = []
+        self._by_tag: Dict[str, List[TaskKey]] = defaultdict(list)
+        self._by_user: Dict[Optional[int], List[TaskKey]] = defaultdict(list)
+        self._by_chat: Dict[int, List[TaskKey]] = defaultdict(list)
+        self._by_tag_user: Dict[Tuple[str, Optional[int]], List[TaskKey]] = defaultdict(list)
+        self._bytes = 0
+        self.evicted = 0
+        # Время самой новой вытесненной задачи: задачи не новее него могут быть только в архиве
+        self.evicted_until = 0
+        # Счётчики изменений: растут при каждом добавлении или удалении задачи с этим тегом/пользователем.
+        # По ним кэш ответов понимает, что список задач устарел
+        self._version = 0
+        self._tag_versions: Dict[str, int] = defaultdict(int)
+        self._user_versions: Dict[Optional[int], int] = defaultdict(int)
+        self._tag_user_versions: Dict[Tuple[str, Optional[int]], int] = defaultdict(int)
+
+    def __len__(self) -> int:
+        return len(self._tasks)
+
+    @property
+    def bytes_used(self) -> int:
+        return self._bytes
+
+    def _bump(self, task: TaskRecord) -> None:
+        self._version += 1
+        self._user_versions[task.user_id] += 1
+        for tag in task.tags:
+            self._tag_versions[tag] += 1
+            self._tag_user_versions[(tag, task.user_id)] += 1
+
+    def version(self, tags: Optional[Iterable[str]] = None, user_id: Optional[int] = None) -> Tuple[int, ...]:
+        """Версия выборки: меняется только при изменении задач, которые в неё попадают."""
+        if tags is not None:
+            if user_id is not None:
+                return tuple(self._tag_user_versions.get((tag, user_id), 0) for tag in tags)
+            return tuple(self._tag_versions.get(tag, 0) for tag in tags)
+        if user_id is not None:
+            return (self._user_versions.get(user_id, 0),)
+        return (self._version,)
+
+    def add(self, task: TaskRecord) -> bool:
+        """Добавляет задачу во все индексы. Повторное сообщение (chat_id, message_id) игнорируется."""
+        key = task.key
+        if key in self._tasks:
+            return False
+        self._tasks[key] = task
+        self._bytes += task.size()
+        self._bump(task)
+        user_id = task.user_id
+        _index_insert(self._all, key)
+        _index_insert(self._by_user[user_id], key)
+        _index_insert(self._by_chat[task.chat_id], key)
+        for tag in task.tags:
+            _index_insert(self._by_tag[tag], key)
+            _index_insert(self._by_tag_user[(tag, user_id)], key)
+        if self.text_index is not None:
+            self.text_index.add(task)
+        self._enforce_retention(task.tags)
+        return True
+
+    def remove(self, key: TaskKey) -> Optional[TaskRecord]:
+        task = self._tasks.pop(key, None)
+        if task is None:
+            return None
+        self._bytes -= task.size()
+        self._bump(task)
+        user_id = task.user_id
+        _index_remove(self._all, key)
+        self._drop_from(self._by_user, user_id, key)
+        self._drop_from(self._by_chat, task.chat_id, key)
+        for tag in task.tags:
+            self._drop_from(self._by_tag, tag, key)
+            self._drop_from(self._by_tag_user, (tag, user_id), key)
+        if self.text_index is not None:
+            self.text_index.remove(task)
+        return task
+
+    def _evict(self, key: TaskKey) -> None:
+        if self.remove(key) is not None:
+            self.evicted += 1
+            self.mark_evicted(key[0])
+
+    def mark_evicted(self, timestamp: int) -> None:
+        """Отмечает, что задач не новее timestamp в памяти может не быть: их нужно дочитывать из архива."""
+        self.evicted_until = max(self.evicted_until, timestamp)
+
+    def _enforce_retention(self, tags: Iterable[str]) -> None:
+        # Вытесняем самые старые задачи: они лежат в начале индексов
+        policy = self.retention
+        if policy.max_per_tag:
+            for tag in tags:
+                index = self._by_tag.get(tag)
+                while index and len(index) > policy.max_per_tag:
+                    self._evict(index[0])
+        if policy.max_bytes:
+            while self._all and self._bytes > policy.max_bytes:
+                self._evict(self._all[0])
+        if policy.max_age:
+            self.expire()
+
+    def expire(self, now: Optional[float] = None) -> int:
+        """Удаляет задачи старше max_age и возвращает их число."""
+        if not self.retention.max_age:
+            return 0
+        threshold = int(now if now is not None else time.time()) - self.retention.max_age
+        count = 0
+        while self._all and self._all[0][0] < threshold:
+            self._evict(self._all[0])
+            count += 1
+        return count
+
+    @staticmethod
+    def _drop_from(indexes: dict, name, key: TaskKey) -> None:
+        index = indexes.get(name)
+        if index is None:
+            return
+        _index_remove(index, key)
+        if not index:
+            del indexes[name]
+
+    def _select_indexes(self, tags: Optional[Iterable[str]], user_id: Optional[int],
+                        chat_id: Optional[int]) -> List[List[TaskKey]]:
+        # Выбираем самый узкий индекс под фильтр, остальные условия проверяются при обходе
+        if tags is not None:
+            if user_id is not None:
+                return [self._by_tag_user[(tag, user_id)] for tag in tags if (tag, user_id) in self._by_tag_user]
+            return [self._by_tag[tag] for tag in tags if tag in self._by_tag]
+        if user_id is not None:
+            return [self._by_user[user_id]] if user_id in self._by_user else []
+        if chat_id is not None:
+            return [self._by_chat[chat_id]] if chat_id in self._by_chat else []
+        return [self._all]
+
+    def get(self, key: TaskKey) -> Optional[TaskRecord]:
+        return self._tasks.get(key)
+
+    def iter_latest(self, tags: Optional[Iterable[str]] = None, user_id: Optional[int] = None,
+                    chat_id: Optional[int] = None, before: Optional[TaskKey] = None) -> Iterator[TaskRecord]:
+        """Лениво отдаёт задачи от новых к старым, без полной сортировки.
+
+        before — ключ последней показанной задачи: выдача продолжается со следующей за ней.
+        """
+        indexes = self._select_indexes(tags, user_id, chat_id)
+        if len(indexes) == 1:
+            keys = _before(indexes[0], before)
+        else:
+            # Задача с несколькими тегами встречается в нескольких индексах — отбрасываем повторы
+            keys = _unique(heapq.merge(*(_before(index, before) for index in indexes), reverse=True))
+        for key in keys:
+            task = self._tasks[key]
+            if chat_id is not None and task.chat_id != chat_id:
+                continue
+            yield task
+
+    def iter_after(self, after: TaskKey, tags: Optional[Iterable[str]] = None, user_id: Optional[int] = None,
+                   chat_id: Optional[int] = None) -> Iterator[TaskRecord]:
+        """Лениво отдаёт задачи новее after, от старых к новым."""
+        indexes = self._select_indexes(tags, user_id, chat_id)
+        if len(indexes) == 1:
+            keys = _after(indexes[0], after)
+        else:
+            keys = _unique(heapq.merge(*(_after(index, after) for index in indexes)))
+        for key in keys:
+            task = self._tasks[key]
+            if chat_id is not None and task.chat_id != chat_id:
+                continue
+            yield task
+
+    def latest(self, tags: Optional[Iterable[str]] = None, user_id: Optional[int] = None,
+               chat_id: Optional[int] = None, limit: int = 10, before: Optional[TaskKey] = None,
+               after: Optional[TaskKey] = None) -> List[TaskRecord]:
+        """Страница задач от новых к старым: самые новые, следующие за before или ближайшие новее after."""
+        if after is not None:
+            tasks = list(islice(self.iter_after(after, tags, user_id, chat_id), limit))
+            tasks.reverse()
+            return tasks
+        return list(islice(self.iter_latest(tags, user_id, chat_id, before), limit))
+
+    def search(self, query: "SearchQuery", user_id: Optional[int], limit: int = 20,
+               before: Optional[TaskKey] = None) -> List[TaskRecord]:
+        """Задачи пользователя, подходящие под поисковый запрос, от новых к старым."""
+        if self.text_index is None:
+            raise RuntimeError("TaskStore создан без text_index")
+        if not query:
+            return self.latest(user_id=user_id, limit=limit, before=before)
+        keys = self.text_index.candidates(user_id, query, before)
+        if keys is None:
+            tasks = self.iter_latest(user_id=user_id, before=before)
+        else:
+            tasks = map(self._tasks.__getitem__, keys)
+        return list(islice((task for task in tasks if query.matches(task.text)), limit))
+
+
+def _unique(keys: Iterator[TaskKey]) -> Iterator[TaskKey]:
+    # Одинаковые ключи после слияния идут подряд
+    previous = None
+    for key in keys:
+        if key != previous:
+            previous = key
+            yield key
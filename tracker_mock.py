@@ -0,0 +1,168 @@
+"""Локальная имитация API Yandex Tracker v2 для проверки синхронизации без доступа к Tracker.
+
+Запуск: python tracker_mock.py --port 8081, затем в .env бота TRACKER_URL=http://127.0.0.1:8081
+"""
+import argparse
+import asyncio
+import hashlib
+import itertools
+import json
+import random
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional, Set
+
+from aiohttp import web
+
+from outbound import TokenBucket
+
+
+STATUSES = (("open", "Открыт"), ("inProgress", "В работе"), ("inReview", "Ревью"), ("closed", "Закрыт"))
+
+
+class MockTracker:
+    """Хранит задачи в памяти и отвечает как Tracker: unique и 409, поиск по фильтру
+    с сортировкой по дате обновления и страницами, ETag и 304, 429 сверх rate запросов в секунду.
+    """
+
+    def __init__(self, queue: str = "TG", rate: float = 0.0, latency: float = 0.0) -> None:
+        self.queue = queue
+        self.latency = latency
+        self.bucket = TokenBucket(rate, max(rate, 1)) if rate else None
+        self.issues: Dict[str, Dict[str, Any]] = {}
+        self._by_unique: Dict[str, str] = {}
+        self._ids = itertools.count(1)
+        self._clock = 0.0
+        self.calls: Counter = Counter()
+        self.throttled = 0
+        self.connections: Set[int] = set()  # Разные TCP-соединения клиентов
+
+    def _now(self) -> str:
+        # Время обновления строго растёт, даже если задачи меняются в одну миллисекунду
+        self._clock = max(self._clock + 0.001, time.time())
+        return time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(self._clock)) + f".{int(self._clock * 1000) % 1000:03d}+0000"
+
+    def touch(self, count: int, seed: Optional[int] = None) -> List[str]:
+        """Меняет статус count случайных задач, как если бы с ними работали в Tracker."""
+        rnd = random.Random(seed)
+        keys = rnd.sample(sorted(self.issues), min(count, len(self.issues)))
+        for key in keys:
+            issue = self.issues[key]
+            current = [status for status, _ in STATUSES].index(issue["status"]["key"])
+            status, display = STATUSES[(current + 1) % len(STATUSES)]
+            issue["status"] = {"key": status, "display": display}
+            issue["updatedAt"] = self._now()
+        return keys
+
+    @staticmethod
+    def _etag(issue: Dict[str, Any]) -> str:
+        return '"' + hashlib.md5(json.dumps(issue, sort_keys=True).encode()).hexdigest() + '"'
+
+    @web.middleware
+    async def _middleware(self, request: web.Request, handler) -> web.StreamResponse:
+        self.connections.add(id(request.transport))
+        self.calls[f"{request.method} {getattr(request.match_info.route.resource, 'canonical', request.path)}"] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.bucket is not None:
+            now = time.monotonic()
+            if self.bucket.wait_time(now) > 0:
+                self.throttled += 1
+                return web.json_response({"errorMessages": ["Too Many Requests"]}, status=429,
+                                         headers={"Retry-After": "1"})
+            self.bucket.consume()
+        if not request.headers.get("Authorization", "").startswith("OAuth "):
+            return web.json_response({"errorMessages": ["Unauthorized"]}, status=401)
+        return await handler(request)
+
+    async def create(self, request: web.Request) -> web.Response:
+        fields = await request.json()
+        if fields.get("queue") != self.queue or not fields.get("summary"):
+            return web.json_response({"errorMessages": ["Invalid queue or summary"]}, status=422)
+        unique = fields.get("unique")
+        if unique and unique in self._by_unique:
+            return web.json_response({"errorMessages": ["Issue with this unique already exists"]}, status=409)
+        key = f"{self.queue}-{next(self._ids)}"
+        now = self._now()
+        issue = {
+            "key": key, "summary": fields["summary"], "description": fields.get("description", ""),
+            "tags": fields.get("tags", []), "unique": unique, "queue": {"key": self.queue},
+            "status": {"key": STATUSES[0][0], "display": STATUSES[0][1]}, "createdAt": now, "updatedAt": now,
+        }
+        self.issues[key] = issue
+        if unique:
+            self._by_unique[unique] = key
+        return web.json_response(issue, status=201)
+
+    async def search(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        filter = body.get("filter", {})
+        page = int(request.query.get("page", 1))
+        per_page = int(request.query.get("perPage", 50))
+        if "unique" in filter:
+            key = self._by_unique.get(filter["unique"])
+            found = [self.issues[key]] if key else []
+        else:
+            since = (filter.get("updated") or {}).get("from", "")
+            tag = filter.get("tags")
+            found = [
+                issue for issue in self.issues.values()
+                if issue["queue"]["key"] == filter.get("queue", self.queue)
+                and issue["updatedAt"] >= since and (not tag or tag in issue["tags"])
+            ]
+            found.sort(key=lambda issue: issue["updatedAt"], reverse=body.get("order", "+updated").startswith("-"))
+        pages = max(1, -(-len(found) // per_page))
+        return web.json_response(found[(page - 1) * per_page:page * per_page],
+                                 headers={"X-Total-Count": str(len(found)), "X-Total-Pages": str(pages)})
+
+    async def get(self, request: web.Request) -> web.Response:
+        issue = self.issues.get(request.match_info["key"])
+        if issue is None:
+            return web.json_response({"errorMessages": ["Not found"]}, status=404)
+        etag = self._etag(issue)
+        if request.headers.get("If-None-Match") == etag:
+            return web.Response(status=304, headers={"ETag": etag})
+        return web.json_response(issue, headers={"ETag": etag})
+
+    def make_app(self) -> web.Application:
+        app = web.Application(middlewares=[self._middleware])
+        app.router.add_post("/v2/issues/", self.create)
+        app.router.add_post("/v2/issues/_search", self.search)
+        app.router.add_get("/v2/issues/{key}", self.get)
+        return app
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Запускает сервер и возвращает его адрес (port=0 — свободный порт)."""
+        self._runner = web.AppRunner(self.make_app(), access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        return "http://%s:%s" % self._runner.addresses[0][:2]
+
+    async def stop(self) -> None:
+        await self._runner.cleanup()
+
+
+async def serve(args) -> None:
+    tracker = MockTracker(args.queue, rate=args.rate, latency=args.latency)
+    url = await tracker.start(args.host, args.port)
+    print(f"Имитация Tracker: {url}, очередь {args.queue}")
+    while True:
+        await asyncio.sleep(args.touch_interval)
+        if args.touch and tracker.issues:
+            tracker.touch(args.touch)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--queue", default="TG")
+    parser.add_argument("--rate", type=float, default=0.0, help="лимит запросов в секунду (0 — без лимита)")
+    parser.add_argument("--latency", type=float, default=0.0, help="задержка ответа, в секундах")
+    parser.add_argument("--touch", type=int, default=5, help="сколько задач менять раз в --touch-interval")
+    parser.add_argument("--touch-interval", type=float, default=10.0)
+    asyncio.run(serve(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
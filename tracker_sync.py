@@ -0,0 +1,426 @@
+import asyncio
+import email.utils
+import logging
+import math
+import re
+import time
+from collections import Counter
+from typing import Any, Dict, List, Mapping, NamedTuple, Optional, Tuple
+
+import aiohttp
+
+from outbound import TokenBucket
+from task_archive import TASK_COLUMNS, Database, _task_from_row
+from task_store import TaskRecord
+
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tracker_issues (
+    chat_id INTEGER NOT NULL,
+    message_id INTEGER NOT NULL,
+    issue_key TEXT,
+    status TEXT,
+    updated_at TEXT,
+    error TEXT,
+    PRIMARY KEY (chat_id, message_id)
+) WITHOUT ROWID;
+CREATE UNIQUE INDEX IF NOT EXISTS tracker_issues_key ON tracker_issues (issue_key);
+CREATE TABLE IF NOT EXISTS tracker_state (
+    name TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+# Тег, по которому задачи из чатов отличаются от остальных задач очереди
+ISSUE_TAG = "telegram"
+# Формат дат Tracker: 2024-01-01T00:00:00.000+0000
+TIME_FORMAT = "%Y-%m-%dT%H:%M:%S.000+0000"
+_HASHTAG_RE = re.compile(r"#\w+")
+
+
+class TrackerError(Exception):
+    def __init__(self, status: int, message: str) -> None:
+        super().__init__(f"{status}: {message}")
+        self.status = status
+
+
+class IssueState(NamedTuple):
+    key: str
+    status: str  # ключ статуса, например open
+    status_display: str
+    updated_at: str
+
+    @classmethod
+    def from_json(cls, issue: Dict[str, Any]) -> "IssueState":
+        status = issue.get("status") or {}
+        return cls(issue["key"], status.get("key", ""), status.get("display", status.get("key", "")),
+                   issue.get("updatedAt", ""))
+
+
+def _retry_after(value: Optional[str], default: float) -> float:
+    """Пауза из заголовка Retry-After: число секунд или HTTP-дата; при ошибке разбора — default."""
+    if not value:
+        return default
+    try:
+        seconds = float(value)
+    except ValueError:
+        pass
+    else:
+        return max(0.0, seconds) if math.isfinite(seconds) else default
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return default
+
+
+class TrackerClient:
+    """Клиент API Yandex Tracker v2 на одной сессии aiohttp с постоянными соединениями.
+
+    Одновременно выполняется не больше max_concurrency запросов, частота ограничена
+    корзиной токенов rate запросов в секунду. На 429 клиент ждёт Retry-After, на 5xx
+    и сетевые ошибки повторяет запрос с растущей паузой. Число вызовов по видам
+    запросов копится в calls.
+    """
+
+    def __init__(self, base_url: str, token: str, org_id: str = "", cloud_org: bool = False,
+                 max_concurrency: int = 8, rate: float = 20.0, timeout: float = 30.0, max_retries: int = 3) -> None:
+        self.base_url = base_url.rstrip("/")
+        self.headers = {"Authorization": f"OAuth {token}"}
+        if org_id:
+            self.headers["X-Cloud-Org-ID" if cloud_org else "X-Org-ID"] = org_id
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.bucket = TokenBucket(rate, max(rate, 1))
+        # Примитивы asyncio создаются при первом запросе: до Python 3.10 они привязаны к циклу,
+        # в котором созданы, а клиент создаётся при импорте bot.py, ещё до asyncio.run
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._session: Optional[aiohttp.ClientSession] = None
+        self.calls: Counter = Counter()
+        self.retries = 0
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_concurrency, keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(
+                connector=connector, headers=self.headers, timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self._session
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    @property
+    def requests(self) -> int:
+        return sum(self.calls.values())
+
+    async def _wait_rate(self) -> None:
+        while True:
+            delay = self.bucket.wait_time(time.monotonic())
+            if delay <= 0:
+                self.bucket.consume()
+                return
+            await asyncio.sleep(delay)
+
+    async def request(self, method: str, path: str, kind: str, json: Any = None,
+                      params: Optional[Dict[str, Any]] = None,
+                      headers: Optional[Dict[str, str]] = None) -> Tuple[int, Any, Mapping[str, str]]:
+        """Возвращает (статус, тело JSON или None, заголовки без учёта регистра); kind — имя вида запроса в calls."""
+        url = self.base_url + path
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        for attempt in range(self.max_retries + 1):
+            async with self._semaphore:
+                await self._wait_rate()
+                self.calls[kind] += 1
+                try:
+                    async with self.session.request(method, url, json=json, params=params, headers=headers) as response:
+                        if response.status == 429 or response.status >= 500:
+                            retry_after = _retry_after(response.headers.get("Retry-After"), 2 ** attempt)
+                            error = TrackerError(response.status, await response.text())
+                        else:
+                            body = await response.json() if response.content_type == "application/json" else None
+                            return response.status, body, response.headers
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    retry_after = 2 ** attempt
+                    error = TrackerError(0, str(e) or type(e).__name__)
+            if attempt == self.max_retries:
+                raise error
+            self.retries += 1
+            if error.status == 429:
+                # Пауза для всех запросов клиента, а не только для этого
+                self.bucket.blocked_until = max(self.bucket.blocked_until, time.monotonic() + retry_after)
+            else:
+                await asyncio.sleep(retry_after)
+        raise AssertionError("unreachable")
+
+    async def create_issue(self, fields: Dict[str, Any]) -> IssueState:
+        status, body, _ = await self.request("POST", "/v2/issues/", "create", json=fields)
+        if status == 409 and "unique" in fields:
+            # Задача уже создана прошлой попыткой, которая не дождалась ответа
+            issues, _ = await self.search({"unique": fields["unique"]}, per_page=1)
+            if issues:
+                return issues[0]
+        if status not in (200, 201):
+            raise TrackerError(status, str(body))
+        return IssueState.from_json(body)
+
+    async def search(self, filter: Dict[str, Any], order: str = "+updated", page: int = 1,
+                     per_page: int = 100) -> Tuple[List[IssueState], int]:
+        """Одна страница поиска: (задачи, всего страниц)."""
+        status, body, headers = await self.request(
+            "POST", "/v2/issues/_search", "search", json={"filter": filter, "order": order},
+            params={"page": page, "perPage": per_page})
+        if status != 200:
+            raise TrackerError(status, str(body))
+        return [IssueState.from_json(issue) for issue in body], int(headers.get("X-Total-Pages", 1))
+
+    async def get_issue(self, key: str, etag: Optional[str] = None) -> Tuple[Optional[IssueState], Optional[str]]:
+        """Задача с условным запросом: (None, etag), если она не менялась с прошлого раза."""
+        status, body, headers = await self.request(
+            "GET", f"/v2/issues/{key}", "get", headers={"If-None-Match": etag} if etag else None)
+        if status == 304:
+            return None, etag
+        if status != 200:
+            raise TrackerError(status, str(body))
+        return IssueState.from_json(body), headers.get("ETag")
+
+
+class IssueCache:
+    """Состояния задач Tracker на ttl секунд; устаревшие перепроверяются по ETag."""
+
+    def __init__(self, ttl: float = 60.0, maxsize: int = 10000) -> None:
+        self.ttl = ttl
+        self.maxsize = maxsize
+        # key -> (состояние, ETag, когда получено)
+        self._items: Dict[str, Tuple[IssueState, Optional[str], float]] = {}
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+
+    def put(self, state: IssueState, etag: Optional[str] = None) -> None:
+        if state.key not in self._items and len(self._items) >= self.maxsize:
+            # Словарь хранит порядок вставки: выбрасываем самую старую запись
+            del self._items[next(iter(self._items))]
+        old = self._items.pop(state.key, None)
+        self._items[state.key] = (state, etag or (old[1] if old and old[0] == state else None), time.monotonic())
+
+    async def get(self, client: TrackerClient, key: str) -> IssueState:
+        cached = self._items.get(key)
+        if cached is not None and time.monotonic() - cached[2] < self.ttl:
+            self.hits += 1
+            return cached[0]
+        state, etag = await client.get_issue(key, cached[1] if cached else None)
+        if state is None:
+            self.revalidated += 1
+            state = cached[0]
+        else:
+            self.misses += 1
+        self.put(state, etag)
+        return state
+
+
+class SyncReport(NamedTuple):
+    pushed: int
+    failed: int
+    pulled: int
+    changed: int
+    requests: int
+    seconds: float
+
+
+class TrackerSync:
+    """Синхронизация архива задач с очередью Yandex Tracker.
+
+    push создаёт задачи Tracker для новых задач архива пачками по batch_size: запросы
+    одной пачки идут параллельно (в пределах лимитов клиента), связи задача—issue
+    записываются одной транзакцией. Поле unique делает создание идемпотентным.
+    pull забирает изменения постранично через поиск по дате обновления, начиная
+    с сохранённого курсора, и обновляет статусы одной транзакцией на страницу.
+    """
+
+    def __init__(self, database: Database, client: TrackerClient, queue: str, since_days: int = 7,
+                 batch_size: int = 50, page_size: int = 100, interval: float = 60.0,
+                 cache_ttl: float = 60.0) -> None:
+        self.database = database
+        self.client = client
+        self.queue = queue
+        self.since_days = since_days
+        self.batch_size = batch_size
+        self.page_size = page_size
+        self.interval = interval
+        self.cache = IssueCache(cache_ttl)
+        self._loop_task: Optional[asyncio.Task] = None
+        self._lock: Optional[asyncio.Lock] = None  # Создаётся в цикле событий, см. TrackerClient
+        self.last_report: Optional[SyncReport] = None
+        self.last_sync: Optional[float] = None
+
+    async def open(self) -> None:
+        """Открывает базу и запускает фоновую синхронизацию; при interval=0 — только вызовами sync."""
+        await self.database.open(SCHEMA)
+        if self.interval > 0:
+            self._loop_task = asyncio.create_task(self._loop())
+            logger.info("Синхронизация с Tracker включена: очередь %s, раз в %s с", self.queue, self.interval)
+        else:
+            logger.info("Синхронизация с Tracker включена: очередь %s, по команде /external sync", self.queue)
+
+    async def close(self) -> None:
+        if self._loop_task is not None:
+            self._loop_task.cancel()
+            try:
+                await self._loop_task
+            except asyncio.CancelledError:
+                pass
+            self._loop_task = None
+        await self.client.close()
+        await self.database.close()
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                await self.sync()
+            except Exception as e:
+                logger.error("Ошибка синхронизации с Tracker: %s", e, exc_info=True)
+            await asyncio.sleep(self.interval)
+
+    async def sync(self) -> SyncReport:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            requests = self.client.requests
+            started = time.perf_counter()
+            pushed, failed = await self.push()
+            pulled, changed = await self.pull()
+            report = SyncReport(pushed, failed, pulled, changed, self.client.requests - requests,
+                                time.perf_counter() - started)
+        self.last_report = report
+        self.last_sync = time.time()
+        if pushed or failed or changed:
+            logger.info("Синхронизация с Tracker: создано %d, ошибок %d, изменений статуса %d, запросов %d за %.1f с",
+                        pushed, failed, changed, report.requests, report.seconds)
+        return report
+
+    # --- push ---
+
+    def _unsynced(self, since: int, limit: int) -> List[TaskRecord]:
+        columns = ", ".join(f"t.{column.strip()}" for column in TASK_COLUMNS.split(","))
+        cursor = self.database.conn.execute(
+            f"SELECT {columns} FROM tasks t LEFT JOIN tracker_issues i USING (chat_id, message_id) "
+            f"WHERE t.date >= ? AND i.chat_id IS NULL ORDER BY t.date LIMIT ?",
+            (since, limit),
+        )
+        # Полный текст из архива: описание задачи в Tracker не обрезается
+        return [_task_from_row(row, text_limit=None) for row in cursor]
+
+    def _save_issues(self, rows: List[tuple]) -> None:
+        with self.database.conn:
+            self.database.conn.executemany(
+                "INSERT OR REPLACE INTO tracker_issues (chat_id, message_id, issue_key, status, updated_at, error) "
+                "VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+    def issue_fields(self, task: TaskRecord) -> Dict[str, Any]:
+        summary = " ".join(_HASHTAG_RE.sub("", task.text).split()) or " ".join(sorted(task.tags))
+        return {
+            "queue": self.queue,
+            "summary": summary[:255],
+            "description": f"{task.text}\n\n{task.link}",
+            "tags": [ISSUE_TAG] + sorted(tag.lstrip("#") for tag in task.tags),
+            "unique": f"{ISSUE_TAG}-{task.chat_id}-{task.message_id}",
+        }
+
+    async def _create(self, task: TaskRecord) -> tuple:
+        try:
+            state = await self.client.create_issue(self.issue_fields(task))
+        except TrackerError as e:
+            if e.status in (0, 429) or e.status >= 500:
+                # Временная ошибка: задача останется несинхронизированной и уйдёт в следующий раз
+                raise
+            logger.warning("Tracker отклонил задачу %s/%s: %s", task.chat_id, task.message_id, e)
+            return task.chat_id, task.message_id, None, None, None, str(e)[:500]
+        self.cache.put(state)
+        return task.chat_id, task.message_id, state.key, state.status, state.updated_at, None
+
+    async def push(self) -> Tuple[int, int]:
+        """Создаёт задачи Tracker для новых задач архива: (создано, отклонено)."""
+        since = int(time.time()) - self.since_days * 86400
+        pushed = failed = 0
+        while True:
+            batch = await self.database.run(self._unsynced, since, self.batch_size)
+            if not batch:
+                break
+            results = await asyncio.gather(*(self._create(task) for task in batch), return_exceptions=True)
+            rows = [row for row in results if not isinstance(row, BaseException)]
+            await self.database.run(self._save_issues, rows)
+            pushed += sum(1 for row in rows if row[2] is not None)
+            failed += sum(1 for row in rows if row[2] is None)
+            errors = [row for row in results if isinstance(row, BaseException)]
+            if errors:
+                # Tracker недоступен или перегружен: остаток подождёт следующего цикла
+                logger.warning("Не удалось создать задач в Tracker: %d (%s)", len(errors), errors[0])
+                break
+            if len(batch) < self.batch_size:
+                break
+        return pushed, failed
+
+    # --- pull ---
+
+    def _state(self, name: str) -> Optional[str]:
+        row = self.database.conn.execute("SELECT value FROM tracker_state WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def _save_statuses(self, states: List[IssueState], cursor: str) -> int:
+        with self.database.conn:
+            before = self.database.conn.total_changes
+            self.database.conn.executemany(
+                "UPDATE tracker_issues SET status = ?, updated_at = ? WHERE issue_key = ? "
+                "AND (status IS NOT ? OR updated_at IS NOT ?)",
+                [(state.status, state.updated_at, state.key, state.status, state.updated_at) for state in states])
+            changed = self.database.conn.total_changes - before
+            self.database.conn.execute("INSERT OR REPLACE INTO tracker_state (name, value) VALUES ('cursor', ?)", (cursor,))
+        return changed
+
+    async def pull(self) -> Tuple[int, int]:
+        """Забирает изменения задач с момента прошлой синхронизации: (получено, изменилось статусов)."""
+        cursor = await self.database.run(self._state, "cursor")
+        if cursor is None:
+            cursor = time.strftime(TIME_FORMAT, time.gmtime(time.time() - self.since_days * 86400))
+        pulled = changed = 0
+        page = pages = 1
+        filter = {"queue": self.queue, "tags": ISSUE_TAG, "updated": {"from": cursor}}
+        while page <= pages:
+            states, pages = await self.client.search(filter, page=page, per_page=self.page_size)
+            if not states:
+                break
+            for state in states:
+                self.cache.put(state)
+            # Курсор двигается только вперёд: задачи с той же датой обновления придут ещё раз, это безопасно
+            cursor = max(cursor, max(state.updated_at for state in states))
+            changed += await self.database.run(self._save_statuses, states, cursor)
+            pulled += len(states)
+            page += 1
+        return pulled, changed
+
+    # --- для /external ---
+
+    def _summary(self, since: int) -> Dict[str, Any]:
+        conn = self.database.conn
+        statuses = conn.execute(
+            "SELECT status, COUNT(*) FROM tracker_issues WHERE issue_key IS NOT NULL GROUP BY status "
+            "ORDER BY COUNT(*) DESC").fetchall()
+        failed = conn.execute("SELECT COUNT(*) FROM tracker_issues WHERE issue_key IS NULL").fetchone()[0]
+        waiting = conn.execute(
+            "SELECT COUNT(*) FROM tasks t LEFT JOIN tracker_issues i USING (chat_id, message_id) "
+            "WHERE t.date >= ? AND i.chat_id IS NULL", (since,)).fetchone()[0]
+        return {"statuses": statuses, "failed": failed, "waiting": waiting}
+
+    async def summary(self) -> Dict[str, Any]:
+        """Задачи Tracker по статусам, отклонённые и ожидающие создания."""
+        return await self.database.run(self._summary, int(time.time()) - self.since_days * 86400)
+
+    async def status(self, key: str) -> IssueState:
+        """Актуальный статус задачи Tracker: из кэша, а после ttl — условным запросом по ETag."""
+        return await self.cache.get(self.client, key)
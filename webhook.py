@@ -0,0 +1,103 @@
+import asyncio
+import logging
+import secrets
+from typing import Optional, Set
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher, types
+
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WebhookServer:
+    """Приём апдейтов через вебхук с ограниченным пулом обработчиков.
+
+    Telegram получает ответ сразу после разбора апдейта, а обработка идёт в фоне:
+    одновременно выполняется не больше max_concurrency обработчиков. Если в работе
+    и в ожидании набралось max_pending апдейтов, сервер отвечает 503, и Telegram
+    повторит доставку позже. При остановке новые апдейты не принимаются, а начатые
+    дорабатываются в течение drain_timeout секунд.
+    """
+
+    def __init__(self, dp: Dispatcher, bot: Bot, path: str = "/webhook", secret_token: str = "",
+                 max_concurrency: int = 32, max_pending: int = 1000, drain_timeout: float = 30.0) -> None:
+        self.dp = dp
+        self.bot = bot
+        self.path = path
+        self.secret_token = secret_token
+        self.max_pending = max_pending
+        self.drain_timeout = drain_timeout
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._in_flight: Set[asyncio.Task] = set()
+        self._draining = False
+        self.rejected = 0
+
+    @property
+    def pending(self) -> int:
+        return len(self._in_flight)
+
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post(self.path, self.handle)
+        return app
+
+    async def handle(self, request: web.Request) -> web.Response:
+        if self.secret_token and not secrets.compare_digest(
+                request.headers.get(SECRET_HEADER, ""), self.secret_token):
+            return web.Response(status=401)
+        if self._draining or self.pending >= self.max_pending:
+            self.rejected += 1
+            return web.Response(status=503)
+        try:
+            update = types.Update.model_validate(await request.json(), context={"bot": self.bot})
+        except Exception as e:
+            logger.warning("Некорректный апдейт в вебхуке: %s", e)
+            return web.Response(status=400)
+        task = asyncio.create_task(self._process(update))
+        self._in_flight.add(task)
+        task.add_done_callback(self._in_flight.discard)
+        return web.Response()
+
+    async def _process(self, update: types.Update) -> None:
+        async with self._semaphore:
+            try:
+                await self.dp.feed_update(self.bot, update)
+            except Exception as e:
+                logger.error("Ошибка обработки апдейта %s: %s", update.update_id, e, exc_info=True)
+
+    async def drain(self) -> None:
+        self._draining = True
+        if not self._in_flight:
+            return
+        logger.info(f"Ожидание завершения обработчиков: {len(self._in_flight)}")
+        done, pending = await asyncio.wait(set(self._in_flight), timeout=self.drain_timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            logger.warning(f"Прервано обработчиков по таймауту: {len(pending)}")
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    async def serve(self, host: str, port: int, stop: asyncio.Event, webhook_url: Optional[str] = None) -> None:
+        # Без журнала доступа aiohttp: иначе на каждый апдейт пишется строка в лог
+        runner = web.AppRunner(self.make_app(), access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, host, port)
+        await site.start()
+        logger.info(f"Вебхук слушает http://{host}:{port}{self.path}")
+        if webhook_url:
+            await self.bot.set_webhook(
+                url=webhook_url,
+                secret_token=self.secret_token or None,
+                allowed_updates=self.dp.resolve_used_update_types()
+            )
+        try:
+            await stop.wait()
+        finally:
+            # Сначала перестаём принимать апдейты, потом дожидаемся начатых обработчиков
+            self._draining = True
+            await site.stop()
+            await self.drain()
+            await runner.cleanup()